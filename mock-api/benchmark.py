@@ -0,0 +1,296 @@
+"""In-process load test for the mock service.
+
+Drives ``create_app()`` through httpx's ASGI transport, so no port, server or
+network is involved, and runs scripted end-to-end journeys from concurrent
+virtual users:
+
+    register -> login -> create project -> add chapters -> split -> list/edit
+    storyboards -> trigger image generation -> poll the task -> complete it
+
+Every request is timed and grouped by route template. The JSON report has
+per-route count, errors and p50/p95/p99, plus overall throughput, so runs
+from different commits can be diffed directly::
+
+    python benchmark.py --concurrency 20 --iterations 5 --output before.json
+
+The app runs against a temporary copy of ``mock_data/data.json`` (or of
+``--data``, e.g. a file from ``generate_dataset.py``); the source file is
+never written.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+SCRIPT_LINES = [
+    "【城门】",
+    "暮色四合，城门缓缓关闭。",
+    "李明：我们得尽快行动。",
+    "王芳（低声）：守卫换班只有一刻钟。",
+    "李明看着她，缓缓说道：“那就现在。”",
+    "“谁在那里？”守卫喊道。",
+]
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.journeys_completed = 0
+        self.journeys_failed = 0
+
+    def observe(self, route: str, status: int, seconds: float, ok: bool) -> None:
+        self.latencies[route].append(seconds)
+        self.statuses[route][status] += 1
+        if not ok:
+            self.errors[route] += 1
+
+    def report(self, wall_seconds: float) -> Dict[str, Any]:
+        routes = {}
+        total = 0
+        for route, values in sorted(self.latencies.items()):
+            values.sort()
+            total += len(values)
+            routes[route] = {
+                "count": len(values),
+                "errors": self.errors[route],
+                "statuses": {str(status): count for status, count in sorted(self.statuses[route].items())},
+                "mean_ms": round(sum(values) / len(values) * 1000, 3),
+                "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+                "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+                "max_ms": round(values[-1] * 1000, 3),
+            }
+        return {
+            "wall_seconds": round(wall_seconds, 3),
+            "requests": total,
+            "requests_per_second": round(total / wall_seconds, 2) if wall_seconds else None,
+            "journeys_completed": self.journeys_completed,
+            "journeys_failed": self.journeys_failed,
+            "journeys_per_second": round(self.journeys_completed / wall_seconds, 2) if wall_seconds else None,
+            "errors": sum(self.errors.values()),
+            "routes": routes,
+        }
+
+
+class JourneyError(Exception):
+    pass
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, run_id: str, index: int, args: argparse.Namespace):
+        self.client = client
+        self.recorder = recorder
+        self.args = args
+        self.email = f"bench-{run_id}-{index}@example.com"
+        self.password = f"bench-password-{index}"
+        self.headers: Dict[str, str] = {}
+
+    async def call(self, method: str, route: str, path: str, expect: tuple = (200, 201, 204), **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        response = await self.client.request(method, path, headers=self.headers, **kwargs)
+        elapsed = time.perf_counter() - started
+        ok = response.status_code in expect
+        self.recorder.observe(f"{method} {route}", response.status_code, elapsed, ok)
+        if not ok:
+            raise JourneyError(f"{method} {path} -> {response.status_code}: {response.text[:200]}")
+        return response.json() if response.content and "json" in response.headers.get("content-type", "") else None
+
+    async def register(self) -> None:
+        await self.call(
+            "POST",
+            "/api/auth/register",
+            "/api/auth/register",
+            json={"email": self.email, "password": self.password, "organization_name": f"压测组织-{self.email}"},
+        )
+
+    async def journey(self, iteration: int) -> None:
+        self.headers = {}
+        login = await self.call(
+            "POST", "/api/auth/login", "/api/auth/login", data={"username": self.email, "password": self.password}
+        )
+        self.headers = {"Authorization": f"Bearer {login['token']}"}
+        await self.call("GET", "/api/auth/me", "/api/auth/me")
+
+        project = await self.call(
+            "POST",
+            "/api/projects",
+            "/api/projects",
+            json={"name": f"压测项目-{iteration}", "project_type": "static_comic", "description": "benchmark"},
+        )
+        project_id = project["id"]
+        chapters = "/api/projects/{project_id}/chapters"
+        for number in range(self.args.chapters):
+            script = "\n".join(SCRIPT_LINES * self.args.script_repeat)
+            chapter = await self.call(
+                "POST",
+                chapters,
+                f"/api/projects/{project_id}/chapters",
+                json={"name": f"第{number + 1}章", "script_content": script, "order_index": number},
+            )
+            await self.call(
+                "POST",
+                chapters + "/{chapter_id}/split",
+                f"/api/projects/{project_id}/chapters/{chapter['id']}/split",
+            )
+            storyboards = await self.call(
+                "GET",
+                chapters + "/{chapter_id}/storyboards",
+                f"/api/projects/{project_id}/chapters/{chapter['id']}/storyboards",
+            )
+            if storyboards:
+                await self.call(
+                    "PATCH",
+                    chapters + "/{chapter_id}/storyboards/{storyboard_id}",
+                    f"/api/projects/{project_id}/chapters/{chapter['id']}/storyboards/{storyboards[0]['id']}",
+                    json={"scene_description": "压测修改后的场景描述"},
+                )
+
+        task = await self.call(
+            "POST",
+            "/api/projects/{project_id}/storyboards:generate-images",
+            f"/api/projects/{project_id}/storyboards:generate-images",
+        )
+        for _ in range(self.args.polls):
+            await self.call("GET", "/api/tasks/{task_id}", f"/api/tasks/{task['id']}")
+        # The mock has no workers; finishing the task stands in for one.
+        await self.call(
+            "PATCH",
+            "/api/tasks/{task_id}",
+            f"/api/tasks/{task['id']}",
+            json={"status": "completed", "progress": 100, "result": {"images": []}},
+        )
+        await self.call("GET", "/api/tasks", "/api/tasks")
+
+    async def run(self, deadline: Optional[float]) -> None:
+        try:
+            await self.register()
+        except JourneyError as exc:
+            self.recorder.journeys_failed += 1
+            if self.args.verbose:
+                print(f"register failed: {exc}", file=sys.stderr)
+            return
+        iteration = 0
+        while iteration < self.args.iterations or (deadline and time.perf_counter() < deadline):
+            if deadline and time.perf_counter() >= deadline:
+                break
+            try:
+                await self.journey(iteration)
+                self.recorder.journeys_completed += 1
+            except JourneyError as exc:
+                self.recorder.journeys_failed += 1
+                if self.args.verbose:
+                    print(f"journey failed: {exc}", file=sys.stderr)
+            iteration += 1
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).resolve().parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    import mock_server
+
+    workdir = Path(tempfile.mkdtemp(prefix="mock-bench-"))
+    try:
+        data_path = workdir / "data.json"
+        shutil.copy(args.data or mock_server.DATA_PATH, data_path)
+        mock_server.DATA_PATH = data_path
+        mock_server.PERSIST_CHANGES = args.persist
+        app = mock_server.create_app()
+        recorder = Recorder()
+        run_id = f"{int(time.time())}-{os.getpid()}"
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", limits=limits, timeout=60) as client:
+                users = [VirtualUser(client, recorder, run_id, index, args) for index in range(args.concurrency)]
+                started = time.perf_counter()
+                deadline = started + args.duration if args.duration else None
+                await asyncio.gather(*(user.run(deadline) for user in users))
+                wall = time.perf_counter() - started
+        return {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "config": {
+                "concurrency": args.concurrency,
+                "iterations": args.iterations,
+                "duration": args.duration,
+                "chapters": args.chapters,
+                "script_repeat": args.script_repeat,
+                "polls": args.polls,
+                "persist": args.persist,
+                "rate_limit": args.rate_limit,
+                "data": args.data,
+            },
+            **recorder.report(wall),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="In-process load test for the mock service")
+    parser.add_argument("--concurrency", type=int, default=10, help="virtual users running journeys in parallel")
+    parser.add_argument("--iterations", type=int, default=3, help="journeys per virtual user")
+    parser.add_argument("--duration", type=float, default=0, help="keep running journeys for this many seconds")
+    parser.add_argument("--chapters", type=int, default=2, help="chapters created per journey")
+    parser.add_argument("--script-repeat", type=int, default=5, help="times the sample script is repeated per chapter")
+    parser.add_argument("--polls", type=int, default=3, help="task status polls per journey")
+    parser.add_argument("--persist", action="store_true", help="write every change to the temporary data file")
+    parser.add_argument(
+        "--rate-limit", action="store_true", help="keep per-organization rate limiting on (off by default)"
+    )
+    parser.add_argument("--data", help="run against a copy of this data file instead of mock_data/data.json")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--verbose", action="store_true", help="print failed journeys to stderr")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    # Read at import time, so it has to be set before mock_server is loaded.
+    os.environ["MOCK_RATE_LIMIT_ENABLED"] = "true" if args.rate_limit else "false"
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    report = asyncio.run(run_benchmark(args))
+    encoded = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(encoded + "\n", encoding="utf-8")
+    else:
+        print(encoded)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,459 @@
+"""Generate large, referentially consistent datasets for the mock service.
+
+The bundled ``mock_data/data.json`` has a handful of rows per collection, which
+hides every O(n) scan in ``MockDatabase``. This script writes a file of the
+same shape at any scale::
+
+    python generate_dataset.py --preset large --seed 7 --output mock_data/data.large.json
+    MOCK_DATA_PATH=mock_data/data.large.json python mock_server.py
+
+Rows are written one at a time while the JSON document is being produced, so
+memory stays flat no matter how many storyboards are requested; only compact
+integer arrays (which organization owns a project, which project owns a
+chapter, ...) are kept to keep references consistent. Tenant sizes follow a
+Zipf distribution (``--skew``), so a few organizations own most projects, as in
+production. The same ``--seed`` and options always produce the same file.
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import random
+import sys
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO
+
+BASE_DATA_PATH = Path(__file__).resolve().parent / "mock_data" / "data.json"
+
+PRESETS: Dict[str, Dict[str, int]] = {
+    "small": {"orgs": 50, "projects": 1_000, "storyboards": 10_000},
+    "medium": {"orgs": 500, "projects": 10_000, "storyboards": 100_000},
+    "large": {"orgs": 5_000, "projects": 100_000, "storyboards": 1_000_000},
+}
+
+SURNAMES = "王李张刘陈杨赵黄周吴徐孙胡朱高林何郭马罗梁宋郑谢韩唐冯于董萧程曹袁邓许傅沈曾彭吕苏卢蒋蔡贾丁魏薛叶阎"
+GIVEN_NAMES = "伟芳娜秀英敏静丽强磊军洋勇艳杰娟涛明超秀兰霞平刚桂英华玉萍红娥玲芬燕彬晨轩宇浩然子涵欣怡思远若曦"
+ORG_SUFFIXES = ["文化传媒有限公司", "动漫工作室", "科技有限公司", "影视制作中心", "创意工作室", "数字内容有限公司"]
+PROJECT_THEMES = ["星河", "长安", "迷雾", "少年", "江湖", "归途", "白夜", "山海", "浮生", "青空", "龙城", "旧梦"]
+PROJECT_SUFFIXES = ["奇谭", "物语", "传说", "日记", "往事", "纪元", "之约", "行记"]
+PLACES = ["皇宫大殿", "城门", "竹林小径", "雨夜街头", "学院礼堂", "山顶古寺", "海边灯塔", "地下酒馆", "城郊驿站"]
+NARRATION_PHRASES = [
+    "暮色四合", "烛火摇曳", "远处传来钟声", "风吹过竹林", "雨水顺着屋檐滴落", "人群渐渐散去",
+    "灯笼在风中轻轻摇晃", "街角的茶馆依旧热闹", "月光洒在青石板上", "城墙上站满了守卫",
+    "他握紧了手中的剑", "她转身望向窗外", "空气中弥漫着花香", "马蹄声由远及近",
+]
+DIALOGUE_PHRASES = [
+    "我们得尽快行动", "你终于来了", "这件事没那么简单", "我不会再让你失望", "跟我走",
+    "守卫换班只有一刻钟", "你还记得那天吗", "别回头", "一切都准备好了", "这不是你的错",
+    "天亮之前必须出城", "我会一直等你", "真相就在眼前", "谁在那里",
+]
+TASK_TYPES = ["text_to_image", "generate_storyboard_images", "generate_storyboard_videos", "generate_character_images"]
+TASK_STATUSES = ["completed"] * 14 + ["failed"] * 2 + ["queued", "running", "retry_scheduled"]
+ASSET_KINDS = [("IMAGE", "character_ip"), ("IMAGE", "scene"), ("AUDIO", "bgm"), ("AUDIO", "voice_clone"), ("VIDEO", "video_effect")]
+ASSET_EXTENSIONS = {"IMAGE": "png", "AUDIO": "mp3", "VIDEO": "mp4"}
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+class Generator:
+    def __init__(self, args: argparse.Namespace, base: Dict[str, Any]):
+        self.args = args
+        self.base = base
+        # Zipf weights: organization rank r gets weight 1 / r**skew.
+        weights = [1 / (rank ** args.skew) for rank in range(1, args.orgs + 1)]
+        self.org_cumulative = list(itertools.accumulate(weights))
+        self.org_admin = array("i", [0]) * (args.orgs + 1)
+        self.project_org = array("i", [0]) * (args.projects + 1)
+        self.project_characters: Dict[int, List[str]] = {}
+        self.chapter_project = array("i", [0])
+        self.asset_org = array("i", [0])
+        self.asset_kind = array("b", [0])
+
+    def rng(self, collection: str) -> random.Random:
+        # One stream per collection keeps each collection stable when another's options change.
+        return random.Random(f"{self.args.seed}:{collection}")
+
+    def pick_org(self, rng: random.Random) -> int:
+        return bisect_left(self.org_cumulative, rng.random() * self.org_cumulative[-1]) + 1
+
+    @staticmethod
+    def timestamp(rng: random.Random, days: int = 700) -> str:
+        moment = EPOCH + timedelta(seconds=rng.randrange(days * 86400))
+        return moment.strftime(TIMESTAMP_FORMAT)
+
+    @staticmethod
+    def person_name(rng: random.Random) -> str:
+        return rng.choice(SURNAMES) + "".join(rng.choice(GIVEN_NAMES) for _ in range(rng.choice((1, 2))))
+
+    @staticmethod
+    def sentence(rng: random.Random, phrases: List[str], min_phrases: int = 1, max_phrases: int = 3) -> str:
+        return "，".join(rng.choice(phrases) for _ in range(rng.randint(min_phrases, max_phrases))) + "。"
+
+    def script(self, rng: random.Random, speakers: List[str]) -> str:
+        lines = [f"【{rng.choice(PLACES)}】"]
+        length = len(lines[0])
+        target = max(20, int(rng.gauss(self.args.script_length, self.args.script_length / 4)))
+        while length < target:
+            roll = rng.random()
+            if roll < 0.35:
+                line = self.sentence(rng, NARRATION_PHRASES, 1, 4)
+            elif roll < 0.75:
+                line = f"{rng.choice(speakers)}：{self.sentence(rng, DIALOGUE_PHRASES, 1, 2)}"
+            else:
+                line = f"{rng.choice(speakers)}说：“{self.sentence(rng, DIALOGUE_PHRASES, 1, 2)}”"
+            lines.append(line)
+            length += len(line) + 1
+        return "\n".join(lines)
+
+    # Collections ------------------------------------------------------------------
+
+    def organizations(self) -> Iterator[Dict[str, Any]]:
+        rng = self.rng("organizations")
+        for org_id in range(1, self.args.orgs + 1):
+            name = f"{rng.choice(PROJECT_THEMES)}{rng.choice(ORG_SUFFIXES)}"
+            yield {"id": org_id, "name": name, "created_at": self.timestamp(rng)}
+
+    def users(self) -> Iterator[Dict[str, Any]]:
+        rng = self.rng("users")
+        share = self.args.users / self.org_cumulative[-1]
+        weight_before = 0.0
+        user_id = 0
+        for org_id in range(1, self.args.orgs + 1):
+            weight = self.org_cumulative[org_id - 1] - weight_before
+            weight_before = self.org_cumulative[org_id - 1]
+            # Every organization has an admin; the first one also gets the editor behind mock-editor-token.
+            count = max(2 if org_id == 1 else 1, round(weight * share))
+            for index in range(count):
+                user_id += 1
+                role = "admin" if index == 0 else "editor"
+                if index == 0:
+                    self.org_admin[org_id] = user_id
+                yield {
+                    "id": user_id,
+                    "username": f"org{org_id}_{role}{index or ''}",
+                    "display_name": self.person_name(rng),
+                    "email": f"user{user_id}@org{org_id}.example.com",
+                    "phone": f"1{rng.choice('3578')}{rng.randrange(10 ** 9):09d}" if rng.random() < 0.6 else None,
+                    "role": role,
+                    "organization_id": org_id,
+                    "is_active": rng.random() > 0.02,
+                    "password": "123456",
+                    "created_at": self.timestamp(rng),
+                }
+
+    def projects(self) -> Iterator[Dict[str, Any]]:
+        rng = self.rng("projects")
+        for project_id in range(1, self.args.projects + 1):
+            org_id = 1 if project_id == 1 else self.pick_org(rng)
+            self.project_org[project_id] = org_id
+            project_type = rng.choice(("static_comic", "dynamic_comic"))
+            yield {
+                "id": project_id,
+                "name": f"{rng.choice(PROJECT_THEMES)}{rng.choice(PROJECT_SUFFIXES)}",
+                "project_type": project_type,
+                "status": rng.choice(("draft", "progress", "progress", "completed")),
+                "description": self.sentence(rng, NARRATION_PHRASES, 2, 5),
+                "prompt": f"创作一部{rng.choice(('温馨治愈', '悬疑', '热血', '古风', '科幻'))}风格的漫剧,{self.sentence(rng, NARRATION_PHRASES, 1, 3)}",
+                "cover_image": f"https://cdn.example.com/covers/{project_id}.jpg",
+                "video_scale": rng.choice(("16:9", "9:16")),
+                "video_resolution": rng.choice(("720p", "1080p")),
+                "organization_id": org_id,
+                "created_by_id": self.org_admin[org_id],
+                "created_at": self.timestamp(rng),
+            }
+
+    def characters(self) -> Iterator[Dict[str, Any]]:
+        rng = self.rng("characters")
+        character_id = 0
+        for project_id in range(1, self.args.projects + 1):
+            names: List[str] = []
+            for _ in range(rng.randint(2, max(2, 2 * self.args.characters_per_project - 2))):
+                name = self.person_name(rng)
+                if name in names:
+                    continue
+                names.append(name)
+                character_id += 1
+                yield {
+                    "id": character_id,
+                    "project_id": project_id,
+                    "display_name": name,
+                    "description": self.sentence(rng, NARRATION_PHRASES, 1, 2),
+                    "prompt": f"{name},{self.sentence(rng, NARRATION_PHRASES, 1, 3)}",
+                    "portraits": [
+                        {"src": f"https://cdn.example.com/portraits/{character_id}_{angle}.png", "alt": alt}
+                        for angle, alt in (("front", "正面"), ("side", "侧面"))
+                    ],
+                    "voice_preset": rng.choice([voice["name"] for voice in self.base.get("voices", [])] or [""]),
+                    "voice_speed": round(rng.uniform(0.9, 1.2), 1),
+                    "voice_script": self.sentence(rng, DIALOGUE_PHRASES, 1, 1),
+                    "created_at": self.timestamp(rng),
+                }
+            # Only the names are kept; the chapters pass uses them as speakers.
+            self.project_characters[project_id] = names
+
+    def scenes(self) -> Iterator[Dict[str, Any]]:
+        rng = self.rng("scenes")
+        scene_id = 0
+        for project_id in range(1, self.args.projects + 1):
+            for _ in range(rng.randint(1, 4)):
+                scene_id += 1
+                place = rng.choice(PLACES)
+                yield {
+                    "id": scene_id,
+                    "project_id": project_id,
+                    "name": place,
+                    "description": self.sentence(rng, NARRATION_PHRASES, 1, 3),
+                    "prompt": f"生成一幅{place}的画面,{self.sentence(rng, NARRATION_PHRASES, 1, 2)}",
+                    "image_url": f"https://cdn.example.com/scenes/{scene_id}.jpg",
+                    "created_at": self.timestamp(rng),
+                }
+
+    def chapters(self) -> Iterator[Dict[str, Any]]:
+        rng = self.rng("chapters")
+        chapter_project = array("i", [0])
+        for project_id in range(1, self.args.projects + 1):
+            speakers = self.project_characters.pop(project_id, None) or [self.person_name(rng)]
+            for order_index in range(rng.randint(1, max(1, 2 * self.args.chapters_per_project - 1))):
+                chapter_project.append(project_id)
+                yield {
+                    "id": len(chapter_project) - 1,
+                    "project_id": project_id,
+                    "name": f"第{order_index + 1}章",
+                    "script_content": self.script(rng, speakers),
+                    "order_index": order_index,
+                    "created_at": self.timestamp(rng),
+                }
+        self.chapter_project = chapter_project
+
+    def storyboards(self) -> Iterator[Dict[str, Any]]:
+        rng = self.rng("storyboards")
+        chapter_count = len(self.chapter_project) - 1
+        per_chapter = array("i", [0]) * (chapter_count + 1)
+        for _ in range(self.args.storyboards):
+            per_chapter[rng.randint(1, chapter_count)] += 1
+        storyboard_id = 0
+        for chapter_id in range(1, chapter_count + 1):
+            for order_index in range(per_chapter[chapter_id]):
+                storyboard_id += 1
+                yield {
+                    "id": storyboard_id,
+                    "project_id": self.chapter_project[chapter_id],
+                    "chapter_id": chapter_id,
+                    "order_index": order_index,
+                    "dialogue": self.sentence(rng, DIALOGUE_PHRASES, 1, 2) if rng.random() < 0.7 else None,
+                    "scene_description": self.sentence(rng, NARRATION_PHRASES, 1, 4),
+                    "image_url": f"https://cdn.example.com/storyboards/{storyboard_id}.jpg" if rng.random() < 0.6 else None,
+                    "created_at": self.timestamp(rng),
+                }
+
+    def assets(self) -> Iterator[Dict[str, Any]]:
+        rng = self.rng("assets")
+        asset_org = array("i", [0])
+        asset_kind = array("b", [0])
+        for asset_id in range(1, self.args.assets + 1):
+            org_id = self.pick_org(rng)
+            kind = rng.randrange(len(ASSET_KINDS))
+            asset_org.append(org_id)
+            asset_kind.append(kind)
+            asset_type, sub_type = ASSET_KINDS[kind]
+            extension = ASSET_EXTENSIONS[asset_type]
+            yield {
+                "id": asset_id,
+                "organization_id": org_id,
+                "name": f"{sub_type}_{asset_id}",
+                "description": self.sentence(rng, NARRATION_PHRASES, 1, 2),
+                "asset_type": asset_type,
+                "sub_type": sub_type,
+                "creation_method": rng.choice(("UPLOAD", "GENERATED")),
+                "tags": rng.sample(PROJECT_THEMES, 2),
+                "file_url": f"https://cdn.example.com/assets/{asset_id}.{extension}",
+                "object_key": f"{org_id}/assets/{asset_id}.{extension}",
+                "uploaded_by_id": self.org_admin[org_id],
+                "created_at": self.timestamp(rng),
+            }
+        self.asset_org = asset_org
+        self.asset_kind = asset_kind
+
+    def storage_objects(self) -> Iterator[Dict[str, Any]]:
+        for asset_id in range(1, len(self.asset_org)):
+            org_id = self.asset_org[asset_id]
+            extension = ASSET_EXTENSIONS[ASSET_KINDS[self.asset_kind[asset_id]][0]]
+            yield {
+                "object_key": f"{org_id}/assets/{asset_id}.{extension}",
+                "url": f"https://cdn.example.com/assets/{asset_id}.{extension}",
+                "organization_id": org_id,
+            }
+
+    def tasks(self) -> Iterator[Dict[str, Any]]:
+        rng = self.rng("tasks")
+        for task_id in range(1, self.args.tasks + 1):
+            project_id = rng.randint(1, self.args.projects)
+            status = rng.choice(TASK_STATUSES)
+            created = EPOCH + timedelta(seconds=rng.randrange(180 * 86400))
+            finished = created + timedelta(seconds=rng.randint(5, 600))
+            failed = status in {"failed", "retry_scheduled"}
+            yield {
+                "id": task_id,
+                "organization_id": self.project_org[project_id],
+                "task_type": rng.choice(TASK_TYPES),
+                "status": status,
+                "payload": {"project_id": project_id},
+                "progress": 100 if status == "completed" else rng.randint(0, 90),
+                "result": {"image_url": f"https://cdn.example.com/results/{task_id}.png"} if status == "completed" else None,
+                "error_message": "上游服务超时" if failed else None,
+                "error_code": "upstream_timeout" if failed else None,
+                "retry_token": None,
+                "attempts": rng.randint(1, 3) if failed else 0,
+                "next_attempt_at": finished.strftime(TIMESTAMP_FORMAT) if status == "retry_scheduled" else None,
+                "created_at": created.strftime(TIMESTAMP_FORMAT),
+                "finished_at": finished.strftime(TIMESTAMP_FORMAT) if status in {"completed", "failed"} else None,
+            }
+
+    def notifications(self) -> Iterator[Dict[str, Any]]:
+        rng = self.rng("notifications")
+        for notification_id in range(1, self.args.notifications + 1):
+            failed = rng.random() < 0.1
+            yield {
+                "id": notification_id,
+                "organization_id": self.pick_org(rng),
+                "title": "任务失败" if failed else "任务完成",
+                "message": f"{rng.choice(('文生图', '分镜生成', '视频生成'))}任务{'失败' if failed else '已完成'}",
+                "type": "error" if failed else "info",
+                "is_read": rng.random() < 0.6,
+                "created_at": self.timestamp(rng, days=180),
+            }
+
+    def subscriptions(self) -> Iterator[Dict[str, Any]]:
+        rng = self.rng("subscriptions")
+        plan_ids = [plan["id"] for plan in self.base.get("plans", [])]
+        subscription_id = 0
+        for org_id in range(1, self.args.orgs + 1):
+            if plan_ids and (org_id == 1 or rng.random() < 0.6):
+                subscription_id += 1
+                yield {
+                    "id": subscription_id,
+                    "organization_id": org_id,
+                    "plan_id": plan_ids[0] if org_id == 1 else rng.choice(plan_ids),
+                    "status": "active",
+                    "created_at": self.timestamp(rng),
+                }
+
+    def payments(self) -> Iterator[Dict[str, Any]]:
+        rng = self.rng("payments")
+        plans = self.base.get("plans", [])
+        for index in range(self.args.orgs // 2 if plans else 0):
+            plan = rng.choice(plans)
+            yield {
+                "order_id": f"ORDER_{self.args.seed:04d}{index:010d}",
+                "organization_id": self.pick_org(rng),
+                "plan_type": plan.get("plan_type"),
+                "amount": plan.get("price"),
+                "status": rng.choice(("paid", "paid", "paid", "pending", "closed")),
+                "created_at": self.timestamp(rng),
+            }
+
+    def api_keys(self) -> Iterator[Dict[str, Any]]:
+        rng = self.rng("api_keys")
+        for key_id in range(1, max(1, self.args.orgs // 10) + 1):
+            value = "sk-" + "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(24))
+            yield {
+                "id": key_id,
+                "organization_id": 1 if key_id == 1 else self.pick_org(rng),
+                "name": "Seedream API Key",
+                "value": value,
+                "masked_value": f"sk-****{value[-3:]}",
+                "created_at": self.timestamp(rng),
+            }
+
+    def collections(self) -> Iterable[tuple[str, Any]]:
+        # Order matters: later collections reference ids recorded by earlier ones.
+        yield "organizations", self.organizations()
+        yield "users", self.users()
+        yield "projects", self.projects()
+        yield "characters", self.characters()
+        yield "chapters", self.chapters()
+        yield "storyboards", self.storyboards()
+        yield "scenes", self.scenes()
+        yield "assets", self.assets()
+        yield "storage_objects", self.storage_objects()
+        yield "tasks", self.tasks()
+        yield "notifications", self.notifications()
+        yield "plans", iter(self.base.get("plans", []))
+        yield "subscriptions", self.subscriptions()
+        yield "payments", self.payments()
+        yield "api_keys", self.api_keys()
+        yield "voices", iter(self.base.get("voices", []))
+        yield "tokens", {"mock-admin-token": 1, "mock-editor-token": 2}
+
+
+def write_dataset(generator: Generator, handle: TextIO, progress: bool = False) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    handle.write("{")
+    for index, (name, rows) in enumerate(generator.collections()):
+        handle.write(("," if index else "") + f"\n  {json.dumps(name)}: ")
+        if isinstance(rows, dict):
+            handle.write(json.dumps(rows, ensure_ascii=False))
+            continue
+        handle.write("[")
+        count = 0
+        for count, row in enumerate(rows, start=1):
+            handle.write(("," if count > 1 else "") + "\n    " + json.dumps(row, ensure_ascii=False))
+        handle.write("\n  ]" if count else "]")
+        counts[name] = count
+        if progress:
+            print(f"{name}: {count}", file=sys.stderr)
+    handle.write("\n}\n")
+    return counts
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generate a large synthetic data.json for the mock service")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small", help="base scale (default: small)")
+    parser.add_argument("--orgs", type=int, help="organizations (overrides the preset)")
+    parser.add_argument("--projects", type=int, help="projects (overrides the preset)")
+    parser.add_argument("--storyboards", type=int, help="storyboards (overrides the preset)")
+    parser.add_argument("--users", type=int, help="users in total; default 3 per organization")
+    parser.add_argument("--assets", type=int, help="assets in total; default 2 per project")
+    parser.add_argument("--tasks", type=int, help="tasks in total; default 1 per project")
+    parser.add_argument("--notifications", type=int, help="notifications in total; default 1 per project")
+    parser.add_argument("--chapters-per-project", type=int, default=3, help="average chapters per project")
+    parser.add_argument("--characters-per-project", type=int, default=4, help="average characters per project")
+    parser.add_argument("--script-length", type=int, default=600, help="average chapter script length in characters")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent for tenant sizes; 0 means uniform")
+    parser.add_argument("--seed", type=int, default=42, help="random seed")
+    parser.add_argument("--base", default=str(BASE_DATA_PATH), help="data file to copy plans and voices from")
+    parser.add_argument("--output", "-o", default="-", help="output path, or - for stdout")
+    parser.add_argument("--progress", action="store_true", help="print row counts to stderr as collections finish")
+    args = parser.parse_args(argv)
+    for field, value in PRESETS[args.preset].items():
+        if getattr(args, field) is None:
+            setattr(args, field, value)
+    args.users = args.users if args.users is not None else 3 * args.orgs
+    args.assets = args.assets if args.assets is not None else 2 * args.projects
+    args.tasks = args.tasks if args.tasks is not None else args.projects
+    args.notifications = args.notifications if args.notifications is not None else args.projects
+    if args.orgs < 1 or args.projects < 1:
+        parser.error("--orgs and --projects must be at least 1")
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    with open(args.base, encoding="utf-8") as handle:
+        base = json.load(handle)
+    generator = Generator(args, base)
+    if args.output == "-":
+        write_dataset(generator, sys.stdout, args.progress)
+    else:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            write_dataset(generator, handle, args.progress)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
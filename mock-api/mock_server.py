@@ -1,13 +1,39 @@
 from __future__ import annotations
 
+import asyncio
+import cProfile
+import functools
+import gzip
+import hashlib
+import heapq
+import hmac
+import io
 import json
+import logging
+import marshal
+import math
 import os
+import pstats
+import queue
 import random
+import re
+import secrets
+import shutil
 import string
+import struct
+import subprocess
+import time
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional
+from urllib.parse import parse_qs, quote
 
 from fastapi import (
     Depends,
@@ -19,6 +45,7 @@ from fastapi import (
     UploadFile,
 )
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel, Field
 
@@ -27,12 +54,31 @@ try:
 except Exception:  # pragma: no cover - passlib optional
     pbkdf2_sha256 = None
 
+try:
+    from PIL import Image, ImageOps
+except Exception:  # pragma: no cover - Pillow optional
+    Image = ImageOps = None
+
 
 def utc_now_iso() -> str:
     """Return RFC3339 timestamp with UTC 'Z' suffix."""
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
 
 
+def utc_iso_days_ago(days: float) -> str:
+    moment = datetime.now(timezone.utc) - timedelta(days=days)
+    return moment.replace(microsecond=0).isoformat().replace("+00:00", "Z")
+
+
+def utc_iso_from_timestamp(timestamp: float) -> str:
+    moment = datetime.fromtimestamp(timestamp, timezone.utc)
+    return moment.replace(microsecond=0).isoformat().replace("+00:00", "Z")
+
+
+def timestamp_from_utc_iso(value: str) -> float:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
 def generate_token(prefix: str, length: int = 12) -> str:
     suffix = "".join(random.choices(string.ascii_letters + string.digits, k=length))
     return f"{prefix}-{suffix}"
@@ -52,14 +98,32 @@ def paginate(items: List[Any], page: int, size: int) -> List[Any]:
 def verify_password(provided: str, stored: str | None) -> bool:
     if stored is None:
         return False
-    if stored == provided:
-        return True
-    if stored.startswith("$") and pbkdf2_sha256:
+    # A hashed password must only ever match through the hash check; comparing the
+    # stored string directly would let anyone holding the hash log in with it.
+    if stored.startswith("$"):
+        if pbkdf2_sha256 is None:
+            return False
         try:
             return pbkdf2_sha256.verify(provided, stored)
         except ValueError:
             return False
-    return False
+    return hmac.compare_digest(stored.encode("utf-8"), provided.encode("utf-8"))
+
+
+def hash_password(password: str) -> str:
+    """Hash with pbkdf2 when passlib is available; CPU-heavy, so call it off the event loop."""
+    return pbkdf2_sha256.hash(password) if pbkdf2_sha256 else password
+
+
+def password_needs_rehash(stored: str) -> bool:
+    return pbkdf2_sha256 is not None and not stored.startswith("$")
+
+
+def content_hash(data: Any) -> str:
+    """Return a stable SHA-256 hex digest of a JSON-serializable value."""
+    encoded = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
 
 @dataclass
 class PaginationResult:
@@ -67,12 +131,1515 @@ class PaginationResult:
     total: int
 
 
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int = 3
+    base_delay: float = 2.0
+    max_delay: float = 60.0
+    jitter: float = 0.5
+    retryable_errors: frozenset = frozenset({"timeout", "rate_limited", "provider_unavailable"})
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential delay before ``attempt + 1``, shortened by up to ``jitter`` of itself."""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return delay * (1 - self.jitter * random.random())
+
+    def should_retry(self, attempt: int, error_code: Optional[str]) -> bool:
+        return attempt < self.max_attempts and error_code in self.retryable_errors
+
+
+class TTLCache:
+    """Bounded mapping whose entries expire ``ttl`` seconds after they were written."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, tuple[float, Any]]" = OrderedDict()
+
+    def _evict_expired(self, now: float) -> None:
+        # Entries share one TTL, so insertion order is also expiry order.
+        while self._data:
+            key, (expires_at, _) = next(iter(self._data.items()))
+            if expires_at > now:
+                break
+            del self._data[key]
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        now = time.monotonic()
+        self._evict_expired(now)
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        return entry[1]
+
+    def set(self, key: Any, value: Any) -> None:
+        now = time.monotonic()
+        self._evict_expired(now)
+        self._data.pop(key, None)
+        self._data[key] = (now + self.ttl, value)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Any, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def values(self) -> List[Any]:
+        self._evict_expired(time.monotonic())
+        return [value for _, value in self._data.values()]
+
+    def __len__(self) -> int:
+        self._evict_expired(time.monotonic())
+        return len(self._data)
+
+
+class SessionStore:
+    """Bearer-token sessions with a sliding TTL and a per-user cap.
+
+    Expiry times sit in a min-heap, so ``sweep`` only touches entries that are
+    due. Refreshing a session pushes a new heap entry instead of moving the old
+    one; stale entries are recognised and dropped when they surface. Refreshes
+    only happen once less than half the TTL remains, so the heap stays within
+    a small multiple of the live session count.
+    """
+
+    def __init__(self, ttl: float, max_per_user: int):
+        self.ttl = ttl
+        self.max_per_user = max_per_user
+        self.expired_total = 0
+        self.evicted_total = 0
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._by_user: Dict[int, "OrderedDict[str, None]"] = defaultdict(OrderedDict)
+        self._expiry: List[tuple[float, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def add(self, token: str, user_id: int, expires_at: Optional[float] = None, created_at: Optional[str] = None) -> None:
+        expires_at = expires_at if expires_at is not None else time.time() + self.ttl
+        self._sessions[token] = {"user_id": user_id, "expires_at": expires_at, "created_at": created_at or utc_now_iso()}
+        heapq.heappush(self._expiry, (expires_at, token))
+        user_tokens = self._by_user[user_id]
+        user_tokens[token] = None
+        while len(user_tokens) > self.max_per_user:
+            oldest, _ = user_tokens.popitem(last=False)
+            del self._sessions[oldest]
+            self.evicted_total += 1
+
+    def get(self, token: str) -> Optional[int]:
+        """Return the session's user id, extending its expiry; ``None`` if unknown or expired."""
+        session = self._sessions.get(token)
+        if session is None:
+            return None
+        now = time.time()
+        if session["expires_at"] <= now:
+            self._remove(token)
+            self.expired_total += 1
+            return None
+        if session["expires_at"] - now < self.ttl / 2:
+            session["expires_at"] = now + self.ttl
+            heapq.heappush(self._expiry, (session["expires_at"], token))
+        return session["user_id"]
+
+    def _remove(self, token: str) -> None:
+        session = self._sessions.pop(token)
+        user_tokens = self._by_user[session["user_id"]]
+        user_tokens.pop(token, None)
+        if not user_tokens:
+            del self._by_user[session["user_id"]]
+
+    def revoke(self, token: str) -> bool:
+        if token not in self._sessions:
+            return False
+        self._remove(token)
+        return True
+
+    def revoke_user(self, user_id: int) -> int:
+        tokens = list(self._by_user.pop(user_id, {}))
+        for token in tokens:
+            del self._sessions[token]
+        return len(tokens)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        removed = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, token = heapq.heappop(self._expiry)
+            session = self._sessions.get(token)
+            if session is not None and session["expires_at"] == expires_at:
+                self._remove(token)
+                removed += 1
+        # Revoked and evicted sessions leave entries behind; rebuild once they dominate.
+        if len(self._expiry) > 4 * len(self._sessions) + 64:
+            self._expiry = [(session["expires_at"], token) for token, session in self._sessions.items()]
+            heapq.heapify(self._expiry)
+        self.expired_total += removed
+        return removed
+
+    def records(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "token": token,
+                "user_id": session["user_id"],
+                "expires_at": utc_iso_from_timestamp(session["expires_at"]),
+                "created_at": session["created_at"],
+            }
+            for token, session in self._sessions.items()
+        ]
+
+    def load(self, records: Iterable[Dict[str, Any]]) -> None:
+        now = time.time()
+        for record in records:
+            expires_at = timestamp_from_utc_iso(record["expires_at"])
+            if expires_at > now:
+                self.add(record["token"], record["user_id"], expires_at, record.get("created_at"))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": len(self._sessions),
+            "users": len(self._by_user),
+            "heap_entries": len(self._expiry),
+            "expired_total": self.expired_total,
+            "evicted_total": self.evicted_total,
+            "ttl_seconds": self.ttl,
+            "max_per_user": self.max_per_user,
+        }
+
+
+class TokenBucketLimiter:
+    """In-memory token buckets, one per key; each check is O(1) and buckets refill lazily."""
+
+    def __init__(self):
+        self._buckets: Dict[Any, List[float]] = {}
+        self.allowed: Dict[str, int] = defaultdict(int)
+        self.rejected: Dict[str, int] = defaultdict(int)
+
+    def acquire(self, key: Any, per_minute: float, burst: float, label: str = "default") -> float:
+        """Take one token; return 0 when allowed, otherwise the seconds until a token is available."""
+        now = time.monotonic()
+        rate = per_minute / 60
+        bucket = self._buckets.setdefault(key, [burst, now])
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            self.allowed[label] += 1
+            return 0.0
+        bucket[0] = tokens
+        self.rejected[label] += 1
+        return (1 - tokens) / rate if rate > 0 else 60.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"buckets": len(self._buckets), "allowed": dict(self.allowed), "rejected": dict(self.rejected)}
+
+
+RATE_LIMITED_ROUTES = [
+    ("video_generation", re.compile(r"^/api/projects/\d+/storyboards:generate-videos$")),
+    (
+        "image_generation",
+        re.compile(r"^/api/(?:tasks/(?:text-to-image|generate-character-images)|projects/\d+/storyboards:generate-images)$"),
+    ),
+    (
+        "tts",
+        re.compile(r"^/api/(?:tts/synthesize(?::stream)?|projects/\d+/chapters/\d+/storyboards:synthesize-speech)$"),
+    ),
+]
+
+
+RATE_LIMIT_KEYS = ("per_minute", "burst")
+
+
+def merge_rate_limits(
+    base: Dict[str, Dict[str, float]], overrides: Optional[Dict[str, Dict[str, float]]]
+) -> Dict[str, Dict[str, float]]:
+    """Overlay ``overrides`` on ``base`` key by key, so an override may set only ``per_minute`` or ``burst``.
+
+    Route classes missing from ``base`` start from the free plan's limits.
+    """
+    limits = {route_class: dict(limit) for route_class, limit in base.items()}
+    for route_class, override in (overrides or {}).items():
+        limits.setdefault(route_class, dict(RATE_LIMITS["free"].get(route_class, {}))).update(override)
+    return limits
+
+
+def validate_rate_limits(limits: Any, complete: bool = True) -> None:
+    """Raise ValueError unless ``limits`` maps known route classes to non-negative ``per_minute``/``burst``.
+
+    With ``complete`` every route class needs both keys; otherwise ``limits`` is
+    an override and may leave keys out.
+    """
+    route_classes = {name for name, _ in RATE_LIMITED_ROUTES}
+    if not isinstance(limits, dict):
+        raise ValueError("rate limits must be an object keyed by route class")
+    for route_class, limit in limits.items():
+        if route_class not in route_classes:
+            raise ValueError(f"Unknown rate limit route class {route_class!r}")
+        if not isinstance(limit, dict):
+            raise ValueError(f"Rate limit for {route_class!r} must be an object")
+        for key, value in limit.items():
+            if key not in RATE_LIMIT_KEYS:
+                raise ValueError(f"Unknown rate limit key {key!r} for {route_class!r}")
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                raise ValueError(f"Rate limit {route_class}.{key} must be a non-negative number")
+        missing = [key for key in RATE_LIMIT_KEYS if key not in limit]
+        if complete and missing:
+            raise ValueError(f"Rate limit for {route_class!r} is missing {', '.join(missing)}")
+    if complete and route_classes - limits.keys():
+        raise ValueError(f"Rate limits are missing route classes {', '.join(sorted(route_classes - limits.keys()))}")
+
+
+def rate_limits_for_plan(plan: Optional[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """Per-route-class limits for a plan: its plan_type defaults, overridden by the plan's own ``rate_limits``."""
+    plan_type = (plan or {}).get("plan_type") or "free"
+    return merge_rate_limits(RATE_LIMITS.get(plan_type, RATE_LIMITS["free"]), (plan or {}).get("rate_limits"))
+
+
+class RateLimitMiddleware:
+    """Reject over-limit POSTs to expensive routes before routing, body parsing or auth dependencies run.
+
+    ``resolve_limit(scope, route_class)`` returns ``(organization_id, per_minute,
+    burst)``, or ``None`` to let the request through (e.g. unauthenticated ones,
+    which the endpoint will refuse anyway).
+    """
+
+    def __init__(self, app: Any, limiter: TokenBucketLimiter, resolve_limit: Callable[..., Optional[tuple]]):
+        self.app = app
+        self.limiter = limiter
+        self.resolve_limit = resolve_limit
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] == "http" and scope["method"] == "POST":
+            route_class = next((name for name, pattern in RATE_LIMITED_ROUTES if pattern.match(scope["path"])), None)
+            limit = self.resolve_limit(scope, route_class) if route_class else None
+            if limit:
+                organization_id, per_minute, burst = limit
+                retry_after = self.limiter.acquire((organization_id, route_class), per_minute, burst, route_class)
+                if retry_after:
+                    response = JSONResponse(
+                        {"detail": f"Rate limit exceeded for {route_class}"},
+                        status_code=429,
+                        headers={"Retry-After": str(math.ceil(retry_after))},
+                    )
+                    await response(scope, receive, send)
+                    return
+        await self.app(scope, receive, send)
+
+
+class LRUCache:
+    """Least-recently-used cache bounded by entry count and serialized payload size."""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[str, tuple[int, Any]]" = OrderedDict()
+
+    @staticmethod
+    def _sizeof(value: Any) -> int:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+
+    def get(self, key: str) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, value: Any) -> None:
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        previous = self._data.pop(key, None)
+        if previous is not None:
+            self.total_bytes -= previous[0]
+        self._data[key] = (size, value)
+        self.total_bytes += size
+        while len(self._data) > self.max_entries or self.total_bytes > self.max_bytes:
+            _, (evicted_size, _) = self._data.popitem(last=False)
+            self.total_bytes -= evicted_size
+            self.evictions += 1
+
+    def discard(self, key: str) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[0]
+
+    def records(self) -> List[Dict[str, Any]]:
+        """Entries from least to most recently used, ready for JSON persistence."""
+        return [{"key": key, "value": value} for key, (_, value) in self._data.items()]
+
+    def load(self, records: Iterable[Dict[str, Any]]) -> None:
+        for record in records:
+            self.put(record["key"], record["value"])
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self.total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class ArchiveStore:
+    """Gzip-compressed JSON-lines segments partitioned by collection and creation month.
+
+    A small manifest records the id and date bounds of every segment so lookups
+    only decompress the segments that can contain a match.
+    """
+
+    def __init__(self, root: Path):
+        self._root = root
+        self._manifest_path = root / "manifest.json"
+        self._manifest: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        if self._manifest_path.exists():
+            with self._manifest_path.open("r", encoding="utf-8") as handle:
+                self._manifest = json.load(handle)
+
+    def _segment_path(self, collection: str, partition: str) -> Path:
+        return self._root / collection / f"{partition}.jsonl.gz"
+
+    def _read_segment(self, collection: str, partition: str) -> Iterator[Dict[str, Any]]:
+        with gzip.open(self._segment_path(collection, partition), "rt", encoding="utf-8") as handle:
+            for line in handle:
+                yield json.loads(line)
+
+    def _write_manifest(self) -> None:
+        tmp_path = self._manifest_path.with_suffix(".tmp")
+        with tmp_path.open("w", encoding="utf-8") as handle:
+            json.dump(self._manifest, handle, ensure_ascii=False, indent=2)
+        tmp_path.replace(self._manifest_path)
+
+    def write(self, collection: str, records: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Write ``records`` into their monthly segments and return each segment's bounds for ``commit``.
+
+        Only segment files are touched, never the manifest, so this can run in a
+        worker thread while queries keep reading. A segment is extended in a copy
+        that then replaces it, so readers never see a half-written gzip member.
+        """
+        by_partition: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for record in records:
+            by_partition[record["created_at"][:7]].append(record)
+        written: Dict[str, Dict[str, Any]] = {}
+        for partition, items in by_partition.items():
+            path = self._segment_path(collection, partition)
+            tmp_path = path.with_suffix(".tmp")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if path.exists():
+                shutil.copyfile(path, tmp_path)
+            # Each write adds a new gzip member; readers see one continuous stream.
+            with gzip.open(tmp_path, "at" if path.exists() else "wt", encoding="utf-8") as handle:
+                for item in items:
+                    handle.write(json.dumps(item, ensure_ascii=False) + "\n")
+            tmp_path.replace(path)
+            ids = [item["id"] for item in items]
+            dates = [item["created_at"] for item in items]
+            written[partition] = {
+                "min_id": min(ids),
+                "max_id": max(ids),
+                "start": min(dates),
+                "end": max(dates),
+                "count": len(items),
+            }
+        return written
+
+    def commit(self, collection: str, written: Dict[str, Dict[str, Any]]) -> int:
+        """Record segments returned by ``write`` in the manifest; returns the number of records added."""
+        if not written:
+            return 0
+        segments = self._manifest.setdefault(collection, {})
+        for partition, bounds in written.items():
+            meta = segments.get(partition)
+            if meta is None:
+                segments[partition] = dict(bounds)
+            else:
+                meta["min_id"] = min(meta["min_id"], bounds["min_id"])
+                meta["max_id"] = max(meta["max_id"], bounds["max_id"])
+                meta["start"] = min(meta["start"], bounds["start"])
+                meta["end"] = max(meta["end"], bounds["end"])
+                meta["count"] += bounds["count"]
+        self._write_manifest()
+        return sum(bounds["count"] for bounds in written.values())
+
+    # find and query decompress segments, so callers run them in a worker thread; they
+    # iterate over a copy of the manifest because commit may extend it meanwhile.
+    def find(self, collection: str, record_id: int) -> Optional[Dict[str, Any]]:
+        for partition, meta in list(self._manifest.get(collection, {}).items()):
+            if not meta["min_id"] <= record_id <= meta["max_id"]:
+                continue
+            for record in self._read_segment(collection, partition):
+                if record["id"] == record_id:
+                    return record
+        return None
+
+    def query(
+        self,
+        collection: str,
+        *,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        predicate: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """Yield archived records created within ``[start, end]``, oldest segment first.
+
+        ``end`` is compared at its own precision, so a date-only ``end`` such as
+        ``2024-01-31`` includes that whole day.
+        """
+        for partition, meta in sorted(self._manifest.get(collection, {}).items()):
+            if (start and meta["end"] < start) or (end and meta["start"][: len(end)] > end):
+                continue
+            for record in self._read_segment(collection, partition):
+                created_at = record["created_at"]
+                if (start and created_at < start) or (end and created_at[: len(end)] > end):
+                    continue
+                if predicate is None or predicate(record):
+                    yield record
+
+    def max_id(self, collection: str) -> int:
+        return max((meta["max_id"] for meta in self._manifest.get(collection, {}).values()), default=0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            collection: {
+                "segments": len(segments),
+                "records": sum(meta["count"] for meta in segments.values()),
+            }
+            for collection, segments in self._manifest.items()
+        }
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+LOOP_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+class Histogram:
+    """Fixed-bucket histogram; quantiles are interpolated inside the matching bucket."""
+
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                if index == len(self.buckets):
+                    return lower
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def summary(self) -> Dict[str, Any]:
+        def rounded(value: Optional[float]) -> Optional[float]:
+            return None if value is None else round(value, 3)
+
+        return {"count": self.count, "p50": rounded(self.quantile(0.5)), "p95": rounded(self.quantile(0.95))}
+
+
+class RateCounter:
+    """Event count over a trailing window, kept as one slot per second."""
+
+    def __init__(self, window: int = 60):
+        self.window = window
+        self._seconds = [0] * window
+        self._counts = [0] * window
+
+    def add(self, amount: int = 1) -> None:
+        second = int(time.time())
+        slot = second % self.window
+        if self._seconds[slot] != second:
+            self._seconds[slot] = second
+            self._counts[slot] = 0
+        self._counts[slot] += amount
+
+    def total(self) -> int:
+        second = int(time.time())
+        return sum(
+            count for slot_second, count in zip(self._seconds, self._counts) if second - slot_second < self.window
+        )
+
+
+REQUEST_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class RequestMetrics:
+    """Per-route request counters, recorded from the event loop only, so no locking is needed."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.requests: Dict[tuple[str, str, int], int] = defaultdict(int)
+        self.durations: Dict[tuple[str, str], Histogram] = {}
+
+    def observe(self, method: str, route: str, status: int, seconds: float) -> None:
+        self.requests[(method, route, status)] += 1
+        histogram = self.durations.get((method, route))
+        if histogram is None:
+            histogram = self.durations[(method, route)] = Histogram(REQUEST_LATENCY_BUCKETS)
+        histogram.observe(seconds)
+
+
+class MetricsMiddleware:
+    """Time every HTTP request and file it under its route template.
+
+    Templates come from the endpoint the router matched, so label cardinality is
+    bounded by the number of routes; anything unmatched is grouped as ``<unmatched>``.
+    """
+
+    def __init__(self, app: Any, metrics: RequestMetrics):
+        self.app = app
+        self.metrics = metrics
+        self._templates: Optional[Dict[Any, str]] = None
+
+    def route_template(self, scope: Dict[str, Any]) -> str:
+        if self._templates is None:
+            self._templates = {
+                route.endpoint: route.path for route in scope["app"].routes if hasattr(route, "endpoint")
+            }
+        return self._templates.get(scope.get("endpoint"), "<unmatched>")
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.metrics.in_flight -= 1
+            self.metrics.observe(scope["method"], self.route_template(scope), status, time.perf_counter() - started)
+
+
+class ProfilingMiddleware:
+    """Run a single request under cProfile when an admin asks for it.
+
+    A request is profiled when it carries ``X-Profile: 1`` or ``?_profile=1``
+    and ``resolve_admin(scope)`` returns the calling admin. The artifact id is
+    returned in the ``X-Profile-Id`` response header. cProfile follows the
+    thread rather than the request, so coroutines of concurrent requests that
+    run while this one awaits show up in the profile too; only one request is
+    profiled at a time.
+    """
+
+    def __init__(self, app: Any, artifacts: TTLCache, resolve_admin: Callable[..., Optional[Dict[str, Any]]]):
+        self.app = app
+        self.artifacts = artifacts
+        self.resolve_admin = resolve_admin
+        self._active = False
+
+    @staticmethod
+    def requested(scope: Dict[str, Any]) -> bool:
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                return value.lower() in {b"1", b"true", b"yes"}
+        query = scope.get("query_string", b"")
+        if b"_profile" not in query:
+            return False
+        return parse_qs(query.decode("latin-1")).get("_profile", [""])[-1].lower() in {"1", "true", "yes"}
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or self._active or not self.requested(scope):
+            await self.app(scope, receive, send)
+            return
+        admin = self.resolve_admin(scope)
+        if admin is None:
+            await self.app(scope, receive, send)
+            return
+        profile_id = secrets.token_hex(8)
+        status = 500
+
+        async def send_with_profile_id(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-profile-id", profile_id.encode("ascii"))]
+            await send(message)
+
+        profiler = cProfile.Profile()
+        self._active = True
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.disable()
+            self._active = False
+            duration = time.perf_counter() - started
+            report = io.StringIO()
+            stats = pstats.Stats(profiler, stream=report)
+            stats.sort_stats("cumulative").print_stats(PROFILE_REPORT_LINES)
+            self.artifacts.set(
+                profile_id,
+                {
+                    "id": profile_id,
+                    "organization_id": admin["organization_id"],
+                    "user_id": admin["id"],
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "query_string": scope.get("query_string", b"").decode("latin-1"),
+                    "status": status,
+                    "duration_ms": round(duration * 1000, 3),
+                    "created_at": utc_now_iso(),
+                    "pstats": marshal.dumps(stats.stats),
+                    "report": report.getvalue(),
+                },
+            )
+
+
+class StoreMetrics:
+    """Persistence and scan counters kept by ``MockDatabase``."""
+
+    def __init__(self):
+        self.dump_seconds = Histogram(REQUEST_LATENCY_BUCKETS)
+        self.dump_bytes_total = 0
+        self.dump_last_bytes = 0
+        self.dump_last_seconds = 0.0
+        self.dump_last_finished: Optional[float] = None
+        self.scans: Dict[str, int] = defaultdict(int)
+        self.scanned_rows: Dict[str, int] = defaultdict(int)
+        self.operation_seconds: Dict[str, Histogram] = {}
+        self.returned_rows: Dict[str, int] = defaultdict(int)
+        self.slow_operations: Dict[str, int] = defaultdict(int)
+
+    def observe_operation(self, operation: str, seconds: float, returned: int) -> None:
+        histogram = self.operation_seconds.get(operation)
+        if histogram is None:
+            histogram = self.operation_seconds[operation] = Histogram(REQUEST_LATENCY_BUCKETS)
+        histogram.observe(seconds)
+        self.returned_rows[operation] += returned
+
+
+LOG = logging.getLogger("mock_server")
+SLOW_LOG = logging.getLogger("mock_server.slow_operations")
+SLOW_LOG.propagate = False
+
+
+class JsonLineFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "message": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def start_slow_log(path: str) -> QueueListener:
+    """Route ``SLOW_LOG`` through a queue so callers never wait on file or terminal I/O."""
+    target = logging.FileHandler(path, encoding="utf-8") if path else logging.StreamHandler()
+    target.setFormatter(JsonLineFormatter())
+    for handler in list(SLOW_LOG.handlers):
+        SLOW_LOG.removeHandler(handler)
+    records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    SLOW_LOG.addHandler(QueueHandler(records))
+    SLOW_LOG.setLevel(logging.INFO)
+    listener = QueueListener(records, target)
+    listener.start()
+    return listener
+
+
+def store_operation(method: Callable[..., Any]) -> Callable[..., Any]:
+    """Time a ``MockDatabase`` method and count the rows it scanned and returned.
+
+    Calls slower than ``SLOW_OPERATION_THRESHOLD_MS`` go to ``SLOW_LOG``. Rows
+    scanned by nested operations (e.g. the ``_dump`` inside an upsert) count
+    towards the outer call as well.
+    """
+    operation = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self: "MockDatabase", *args: Any, **kwargs: Any) -> Any:
+        outer_scanned = self._operation_scanned
+        self._operation_scanned = 0
+        started = time.perf_counter()
+        try:
+            result = method(self, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            scanned = self._operation_scanned
+            self._operation_scanned = outer_scanned + scanned
+        # Lists are result sets; anything else (e.g. one user dict) is a single row.
+        returned = len(result) if isinstance(result, list) else int(result is not None)
+        self.metrics.observe_operation(operation, elapsed, returned)
+        if SLOW_OPERATION_THRESHOLD_MS >= 0 and elapsed * 1000 >= SLOW_OPERATION_THRESHOLD_MS:
+            self.metrics.slow_operations[operation] += 1
+            SLOW_LOG.warning(
+                "slow store operation",
+                extra={
+                    "fields": {
+                        "operation": operation,
+                        "elapsed_ms": round(elapsed * 1000, 3),
+                        "rows_scanned": scanned,
+                        "rows_returned": returned,
+                        "args": [arg for arg in args if isinstance(arg, (int, float))],
+                        "kwargs": {key: value for key, value in kwargs.items() if isinstance(value, (int, float))},
+                    }
+                },
+            )
+        return result
+
+    return wrapper
+
+
+def prometheus_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        text = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{text}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class PrometheusExposition:
+    """Builds a scrape body in the Prometheus text format (version 0.0.4)."""
+
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def metric(self, name: str, kind: str, help_text: str, samples: Iterable[tuple[Dict[str, Any], float]]) -> None:
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            self.lines.append(f"{name}{prometheus_labels(labels)} {value}")
+
+    def histogram(self, name: str, help_text: str, samples: Iterable[tuple[Dict[str, Any], Histogram]]) -> None:
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in samples:
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                self.lines.append(f"{name}_bucket{prometheus_labels({**labels, 'le': bound})} {cumulative}")
+            self.lines.append(f"{name}_bucket{prometheus_labels({**labels, 'le': '+Inf'})} {histogram.count}")
+            self.lines.append(f"{name}_sum{prometheus_labels(labels)} {histogram.sum}")
+            self.lines.append(f"{name}_count{prometheus_labels(labels)} {histogram.count}")
+
+    def render(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+class TaskStats:
+    """Per-organization task counters maintained on every status transition.
+
+    Queue wait is measured from entering ``queued`` to entering ``running``, and
+    run time from ``running`` to the next status.
+    """
+
+    def __init__(self) -> None:
+        self._orgs: Dict[int, Dict[str, Any]] = {}
+        self._queued_since: Dict[int, float] = {}
+        self._running_since: Dict[int, float] = {}
+
+    def _org(self, organization_id: int) -> Dict[str, Any]:
+        stats = self._orgs.get(organization_id)
+        if stats is None:
+            stats = self._orgs[organization_id] = {
+                "by_status": defaultdict(int),
+                "by_type": defaultdict(lambda: defaultdict(int)),
+                "throughput": RateCounter(),
+                "queue_wait": Histogram(),
+                "run_time": Histogram(),
+            }
+        return stats
+
+    def _count(self, task: Dict[str, Any], status: str, delta: int) -> None:
+        stats = self._org(task["organization_id"])
+        stats["by_status"][status] += delta
+        stats["by_type"][task["task_type"]][status] += delta
+
+    def add(self, task: Dict[str, Any]) -> None:
+        self._count(task, task["status"], 1)
+        if task["status"] == "queued":
+            self._queued_since[task["id"]] = time.time()
+        elif task["status"] == "running":
+            self._running_since[task["id"]] = time.time()
+
+    def remove(self, task: Dict[str, Any]) -> None:
+        self._count(task, task["status"], -1)
+        self._queued_since.pop(task["id"], None)
+        self._running_since.pop(task["id"], None)
+
+    def transition(self, task: Dict[str, Any], previous_status: str) -> None:
+        status = task["status"]
+        if status == previous_status:
+            return
+        self._count(task, previous_status, -1)
+        self._count(task, status, 1)
+        stats = self._org(task["organization_id"])
+        now = time.time()
+        started_at = self._running_since.pop(task["id"], None)
+        if started_at is not None:
+            stats["run_time"].observe(now - started_at)
+        queued_at = self._queued_since.pop(task["id"], None)
+        if status == "running":
+            if queued_at is not None:
+                stats["queue_wait"].observe(now - queued_at)
+            self._running_since[task["id"]] = now
+        elif status == "queued":
+            self._queued_since[task["id"]] = now
+        if status in FINISHED_TASK_STATUSES:
+            stats["throughput"].add()
+
+    def snapshot(self, organization_id: int) -> Dict[str, Any]:
+        stats = self._org(organization_id)
+        return {
+            "by_status": {status: count for status, count in stats["by_status"].items() if count},
+            "by_type": {
+                task_type: {status: count for status, count in statuses.items() if count}
+                for task_type, statuses in stats["by_type"].items()
+                if any(statuses.values())
+            },
+            "throughput_per_minute": stats["throughput"].total(),
+            "queue_wait_seconds": stats["queue_wait"].summary(),
+            "run_time_seconds": stats["run_time"].summary(),
+        }
+
+    def status_totals(self) -> Dict[str, int]:
+        totals: Dict[str, int] = defaultdict(int)
+        for stats in self._orgs.values():
+            for status, count in stats["by_status"].items():
+                totals[status] += count
+        return {status: count for status, count in totals.items() if count}
+
+
+def process_rss_bytes() -> Optional[int]:
+    """Resident set size of this process, or ``None`` where ``/proc`` is unavailable."""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as handle:
+            return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Encode an event dict as a Server-Sent Events frame."""
+    lines = []
+    if event.get("id"):
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event.get('event', 'message')}")
+    data = event.get("data", "")
+    if not isinstance(data, str):
+        data = json.dumps(data, ensure_ascii=False)
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+async def run_workflow_events(payload: "WorkflowRunRequest") -> AsyncIterator[Dict[str, Any]]:
+    """Yield workflow events as the (mock) agent produces them."""
+    for index, text in enumerate(["生成的内容...", "更多创意灵感。"], start=1):
+        if WORKFLOW_EVENT_DELAY_SECONDS:
+            await asyncio.sleep(WORKFLOW_EVENT_DELAY_SECONDS)
+        yield {"event": "message", "data": text, "id": f"event_{index}"}
+
+
+async def iter_upload_file(upload: UploadFile, chunk_size: int) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+class LocalObjectStore:
+    """Content-addressed filesystem object store.
+
+    Bodies are streamed to a temporary file while being hashed, then kept once
+    under ``.blobs/<sha[:2]>/<sha256>``; object keys are only metadata that point
+    at a blob, so uploading the same bytes twice stores them once. Multipart
+    uploads keep each part as its own file under ``.multipart/<upload_id>`` next
+    to a ``session.json``, so an interrupted upload can be resumed after a restart.
+    """
+
+    _UPLOAD_ID_PATTERN = re.compile(r"^[A-Za-z0-9-]+$")
+    _SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+    def __init__(self, root: Path, chunk_size: int):
+        self.root = root
+        self.chunk_size = chunk_size
+        self._blobs_root = root / ".blobs"
+        self._derivatives_root = root / ".derivatives"
+        self._uploads_root = root / ".multipart"
+        self._tmp_root = root / ".tmp"
+
+    def blob_path(self, sha256: str) -> Path:
+        if not self._SHA256_PATTERN.match(sha256):
+            raise ValueError(f"Invalid content hash: {sha256}")
+        return self._blobs_root / sha256[:2] / sha256
+
+    def has_blob(self, sha256: str) -> bool:
+        return self.blob_path(sha256).exists()
+
+    def delete_blob(self, sha256: str) -> None:
+        self.blob_path(sha256).unlink(missing_ok=True)
+        shutil.rmtree(self.derivative_dir(sha256), ignore_errors=True)
+
+    def derivative_dir(self, sha256: str) -> Path:
+        self.blob_path(sha256)  # validates the hash
+        return self._derivatives_root / sha256[:2] / sha256
+
+    async def _spool(self, directory: Path, chunks: AsyncIterator[bytes]) -> tuple[Path, Dict[str, Any]]:
+        await asyncio.to_thread(directory.mkdir, parents=True, exist_ok=True)
+        tmp_path = directory / f".{generate_token('tmp', 8)}"
+        digest = hashlib.sha256()
+        size = 0
+        handle = await asyncio.to_thread(tmp_path.open, "wb")
+        try:
+            async for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                await asyncio.to_thread(handle.write, chunk)
+        except BaseException:
+            handle.close()
+            tmp_path.unlink(missing_ok=True)
+            raise
+        handle.close()
+        return tmp_path, {"size": size, "sha256": digest.hexdigest()}
+
+    def _commit_blob(self, tmp_path: Path, written: Dict[str, Any]) -> Dict[str, Any]:
+        blob_path = self.blob_path(written["sha256"])
+        if blob_path.exists():
+            tmp_path.unlink()
+            return {**written, "deduplicated": True}
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path.replace(blob_path)
+        return {**written, "deduplicated": False}
+
+    async def put_stream(self, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+        tmp_path, written = await self._spool(self._tmp_root, chunks)
+        return self._commit_blob(tmp_path, written)
+
+    def _session_dir(self, upload_id: str) -> Path:
+        if not self._UPLOAD_ID_PATTERN.match(upload_id):
+            raise ValueError(f"Invalid upload id: {upload_id}")
+        return self._uploads_root / upload_id
+
+    def create_multipart(self, object_key: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        upload_id = generate_token("mpu", 16)
+        session = {"upload_id": upload_id, "object_key": object_key, **metadata, "created_at": utc_now_iso()}
+        session_dir = self._session_dir(upload_id)
+        session_dir.mkdir(parents=True)
+        with (session_dir / "session.json").open("w", encoding="utf-8") as handle:
+            json.dump(session, handle, ensure_ascii=False)
+        return session
+
+    def get_multipart(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        session_path = self._session_dir(upload_id) / "session.json"
+        if not session_path.exists():
+            return None
+        with session_path.open("r", encoding="utf-8") as handle:
+            session = json.load(handle)
+        session["parts"] = [
+            {"part_number": int(path.name), "size": path.stat().st_size}
+            for path in sorted(session_path.parent.iterdir())
+            if path.name.isdigit()
+        ]
+        return session
+
+    async def put_part(self, upload_id: str, part_number: int, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+        session_dir = self._session_dir(upload_id)
+        tmp_path, written = await self._spool(session_dir, chunks)
+        tmp_path.replace(session_dir / f"{part_number:05d}")
+        return {"part_number": part_number, "size": written["size"], "etag": written["sha256"]}
+
+    def _concatenate_parts(self, session: Dict[str, Any]) -> Dict[str, Any]:
+        session_dir = self._session_dir(session["upload_id"])
+        self._tmp_root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._tmp_root / f".{generate_token('tmp', 8)}"
+        digest = hashlib.sha256()
+        size = 0
+        with tmp_path.open("wb") as output:
+            for part in session["parts"]:
+                with (session_dir / f"{part['part_number']:05d}").open("rb") as source:
+                    while True:
+                        chunk = source.read(self.chunk_size)
+                        if not chunk:
+                            break
+                        digest.update(chunk)
+                        size += len(chunk)
+                        output.write(chunk)
+        written = self._commit_blob(tmp_path, {"size": size, "sha256": digest.hexdigest()})
+        shutil.rmtree(session_dir, ignore_errors=True)
+        return {**written, "parts": len(session["parts"])}
+
+    async def complete_multipart(self, session: Dict[str, Any]) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._concatenate_parts, session)
+
+    def abort_multipart(self, upload_id: str) -> None:
+        shutil.rmtree(self._session_dir(upload_id), ignore_errors=True)
+
+
+def sign_object_url(secret: bytes, object_key: str, expires: int) -> str:
+    message = f"{object_key}\n{expires}".encode("utf-8")
+    return hmac.new(secret, message, hashlib.sha256).hexdigest()
+
+
+def verify_object_signature(secret: bytes, object_key: str, expires: int, signature: str) -> bool:
+    """Check a presigned URL from its own parameters; no store lookup is needed."""
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(sign_object_url(secret, object_key, expires), signature)
+
+
+def parse_byte_range(header: str, size: int) -> Optional[tuple[int, int]]:
+    """Return the inclusive ``(start, end)`` of a single ``bytes=`` range.
+
+    Malformed, reversed (``start > end``) or multi-range headers return ``None``
+    so the whole body is served, as RFC 9110 requires for invalid ranges; ranges
+    that start past the end raise 416.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0:
+                return None
+            start, end = max(size - suffix, 0), size - 1
+        else:
+            start = int(first)
+            if last and int(last) < start:
+                return None
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise HTTPException(
+            status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+
+async def iter_file_range(path: Path, start: int, end: int, chunk_size: int) -> AsyncIterator[bytes]:
+    handle = await asyncio.to_thread(path.open, "rb")
+    try:
+        handle.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(handle.read, min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        handle.close()
+
+
+TTS_PLACEHOLDER_AUDIO_BASE64 = "UklGRjIAAABXQVZFZm10IBAAAAABAAEA..."
+
+
+def tts_cache_key(params: Dict[str, Any]) -> str:
+    return content_hash(
+        {
+            "text": params["text"],
+            "voice_type": params.get("voice_type"),
+            "emotion": params.get("emotion"),
+            "speed": params.get("speed"),
+            "volume": params.get("volume"),
+            "sample_rate": params.get("sample_rate"),
+            "audio_format": params.get("audio_format"),
+        }
+    )
+
+
+def tts_audio_url(params: Dict[str, Any]) -> str:
+    """Audio URLs are addressed by the request parameters, so synthesized audio can be found again."""
+    audio_format = params.get("audio_format") or "mp3"
+    return f"https://oss.example.com/tts/{tts_cache_key(params)}.{audio_format}"
+
+
+async def synthesize_tts_audio(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Stand-in for the TTS provider call."""
+    if TTS_SYNTHESIS_DELAY_SECONDS:
+        await asyncio.sleep(TTS_SYNTHESIS_DELAY_SECONDS)
+    return {"audio_url": tts_audio_url(params)}
+
+
+def wav_header(sample_rate: int, data_size: int, channels: int = 1, bits_per_sample: int = 16) -> bytes:
+    byte_rate = sample_rate * channels * bits_per_sample // 8
+    block_align = channels * bits_per_sample // 8
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF",
+        36 + data_size,
+        b"WAVE",
+        b"fmt ",
+        16,
+        1,
+        channels,
+        sample_rate,
+        byte_rate,
+        block_align,
+        bits_per_sample,
+        b"data",
+        data_size,
+    )
+
+
+def tts_audio_data_size(params: Dict[str, Any]) -> int:
+    """Size of the PCM payload ``stream_tts_audio`` produces for ``params``, excluding the WAV header."""
+    sample_rate = params.get("sample_rate") or 24000
+    speed = params.get("speed") or 1.0
+    return max(0, int(len(params["text"]) * TTS_SECONDS_PER_CHARACTER / speed * sample_rate) * 2)
+
+
+async def stream_tts_audio(params: Dict[str, Any]) -> AsyncIterator[bytes]:
+    """Stand-in for a streaming TTS provider: 16-bit mono PCM WAV, yielded chunk by chunk.
+
+    The mock always produces WAV, whatever ``audio_format`` asks for, since it
+    has no encoder; the clip length scales with the text.
+    """
+    sample_rate = params.get("sample_rate") or 24000
+    data_size = tts_audio_data_size(params)
+    chunk_count = max(1, -(-data_size // TTS_STREAM_CHUNK_BYTES))
+    yield wav_header(sample_rate, data_size)
+    remaining = data_size
+    while remaining > 0:
+        if TTS_SYNTHESIS_DELAY_SECONDS:
+            await asyncio.sleep(TTS_SYNTHESIS_DELAY_SECONDS / chunk_count)
+        size = min(TTS_STREAM_CHUNK_BYTES, remaining)
+        remaining -= size
+        yield bytes(size)
+
+
+class TtsJob:
+    """Audio produced by an asynchronous TTS request, readable while it is still being generated."""
+
+    def __init__(self, task_id: str, organization_id: int, params: Dict[str, Any]):
+        self.task_id = task_id
+        self.organization_id = organization_id
+        self.params = params
+        self.status = "running"
+        self.audio_url: Optional[str] = None
+        self.error_message: Optional[str] = None
+        self.created_at = utc_now_iso()
+        # Known up front, so the job can be charged against TTS_JOB_MAX_BYTES before it starts.
+        self.audio_bytes = len(wav_header(0, 0)) + tts_audio_data_size(params)
+        self._chunks: List[bytes] = []
+        self._changed = asyncio.Condition()
+
+    async def append(self, chunk: bytes) -> None:
+        async with self._changed:
+            self._chunks.append(chunk)
+            self._changed.notify_all()
+
+    async def finish(self, status: str, audio_url: Optional[str] = None, error_message: Optional[str] = None) -> None:
+        async with self._changed:
+            self.status = status
+            self.audio_url = audio_url
+            self.error_message = error_message
+            self._changed.notify_all()
+
+    async def iter_chunks(self) -> AsyncIterator[bytes]:
+        index = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: index < len(self._chunks) or self.status != "running")
+                pending = self._chunks[index:]
+                finished = self.status != "running"
+            index += len(pending)
+            for chunk in pending:
+                yield chunk
+            if finished and index == len(self._chunks):
+                return
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "task_id": self.task_id,
+            "status": self.status,
+            "audio_url": self.audio_url,
+            "error_message": self.error_message,
+            "bytes_generated": sum(len(chunk) for chunk in self._chunks),
+            "created_at": self.created_at,
+        }
+
+
+class VoiceCatalog:
+    """Read-only voice list with per-field indexes and memoized, pre-encoded filter results."""
+
+    INDEXED_FIELDS = ("scene_category", "gender", "support_language", "is_support_mix")
+
+    def __init__(self, voices: List[Dict[str, Any]], max_cached_queries: int = 256):
+        self.voices = voices
+        self.version = content_hash(voices)[:16]
+        self._indexes: Dict[str, Dict[Any, frozenset[int]]] = {}
+        for field in self.INDEXED_FIELDS:
+            postings: Dict[Any, set[int]] = defaultdict(set)
+            for position, voice in enumerate(voices):
+                value = voice.get(field)
+                postings[bool(value) if field == "is_support_mix" else value].add(position)
+            self._indexes[field] = {value: frozenset(items) for value, items in postings.items()}
+        self._responses: OrderedDict[tuple, tuple[bytes, str]] = OrderedDict()
+        self._max_cached_queries = max_cached_queries
+
+    def filter(self, criteria: Dict[str, Any]) -> List[Dict[str, Any]]:
+        postings = [self._indexes[field].get(value, frozenset()) for field, value in criteria.items()]
+        if not postings:
+            return list(self.voices)
+        postings.sort(key=len)
+        matched = postings[0].intersection(*postings[1:])
+        return [self.voices[position] for position in sorted(matched)]
+
+    def response(self, criteria: Dict[str, Any]) -> tuple[bytes, str]:
+        """Return the JSON body and ETag for a filter, encoding each distinct filter only once."""
+        key = tuple(sorted(criteria.items()))
+        cached = self._responses.get(key)
+        if cached is not None:
+            self._responses.move_to_end(key)
+            return cached
+        body = json.dumps(self.filter(criteria), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        cached = (body, f'"{self.version}-{hashlib.sha256(body).hexdigest()[:16]}"')
+        self._responses[key] = cached
+        if len(self._responses) > self._max_cached_queries:
+            self._responses.popitem(last=False)
+        return cached
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header matches ``etag``, using the weak comparison RFC 9110 requires for it."""
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque_tag for candidate in if_none_match.split(","))
+
+
+SCRIPT_SCENE_HEADING = re.compile(
+    r"^(?:【(?P<bracket>[^】]+)】|(?:场景|地点|画面)\s*[：:]\s*(?P<label>.+)|第[一二三四五六七八九十百千\d]+[幕场]\s*(?P<act>.*))$"
+)
+# The speaker must contain a non-digit and no "/" may follow the colon, so
+# "http://…" or "12:30" stay narration.
+SCRIPT_DIALOGUE_LINE = re.compile(
+    r"^(?P<speaker>(?!\d+\s*[：:])[^\s：:，。！？、“”「」（）()/]{1,12})\s*(?:[（(](?P<direction>[^）)]*)[）)])?"
+    r"\s*[：:](?!\s*/)\s*(?P<text>.+)$"
+)
+SCRIPT_QUOTE = re.compile(r"[“「\"](?P<text>[^”」\"]+)[”」\"]")
+SCRIPT_SPEECH_MANNER = r"(?:低声|大声|冷冷地|淡淡地|笑着|轻声|沉声|缓缓|喃喃)?"
+SCRIPT_SPEECH_VERB = r"(?:说道|问道|喊道|叫道|答道|笑道|说|问|喊|道|回答)"
+SCRIPT_SPEECH_TAG = re.compile(
+    rf"(?P<subject>[^，。！？；,.!?;]*?){SCRIPT_SPEECH_MANNER}{SCRIPT_SPEECH_VERB}\s*[：:，,]?\s*$"
+)
+SCRIPT_TRAILING_SPEECH_TAG = re.compile(
+    rf"^[，,]?\s*(?P<subject>[^，。！？；,.!?;“「\"]{{1,8}}?){SCRIPT_SPEECH_MANNER}{SCRIPT_SPEECH_VERB}\s*[。.，,！!]?"
+)
+SCRIPT_PRONOUNS = {"他", "她", "它", "我", "你", "他们", "她们", "我们", "你们"}
+SCRIPT_SCENE_MAX_CHARS = 200
+
+
+def detect_speaker(context: str, clause: str, known_speakers: Iterable[str]) -> Optional[str]:
+    """Guess a speaker: the last known name in ``context``, else a short ``clause`` that reads like a name."""
+    named = [(context.rfind(name), name) for name in known_speakers if name and name in context]
+    if named:
+        return max(named)[1]
+    clause = clause.strip()
+    if 1 < len(clause) <= 4 and clause not in SCRIPT_PRONOUNS:
+        return clause
+    return None
+
+
+def split_script(script: str, known_speakers: Iterable[str] = ()) -> List[Dict[str, Optional[str]]]:
+    """Segment a chapter script into storyboard-sized pieces.
+
+    Handles both screenplay lines (``角色：台词``) and prose with quoted speech.
+    Narration becomes the scene description of the next line of dialogue, or a
+    storyboard of its own once it grows past ``SCRIPT_SCENE_MAX_CHARS``.
+    Pure and picklable so it can run in a worker process.
+    """
+    known_speakers = tuple(known_speakers)
+    segments: List[Dict[str, Optional[str]]] = []
+    scene: Optional[str] = None
+    narration: List[str] = []
+
+    def scene_text() -> Optional[str]:
+        text = "".join(narration).strip()
+        narration.clear()
+        return text or scene
+
+    def add_narration(text: str) -> None:
+        text = text.strip().rstrip("：:，,")
+        if not text:
+            return
+        if narration and sum(map(len, narration)) + len(text) > SCRIPT_SCENE_MAX_CHARS:
+            segments.append({"speaker": None, "dialogue": None, "scene_description": scene_text()})
+        narration.append(text)
+
+    def add_dialogue(speaker: Optional[str], text: str) -> None:
+        segments.append({"speaker": speaker, "dialogue": text.strip(), "scene_description": scene_text()})
+
+    for raw_line in script.splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+        heading = SCRIPT_SCENE_HEADING.match(line)
+        if heading:
+            if narration:
+                segments.append({"speaker": None, "dialogue": None, "scene_description": scene_text()})
+            scene = (heading.group("bracket") or heading.group("label") or heading.group("act") or line).strip()
+            continue
+        quotes = list(SCRIPT_QUOTE.finditer(line))
+        if not quotes:
+            screenplay = SCRIPT_DIALOGUE_LINE.match(line)
+            if screenplay:
+                add_dialogue(screenplay.group("speaker"), screenplay.group("text"))
+            else:
+                add_narration(line)
+            continue
+        cursor = 0
+        for quote in quotes + [None]:
+            context = line[cursor : quote.start() if quote else len(line)]
+            if cursor:
+                # "……”张三喊道。" attributes the quote that was just emitted.
+                trailing = SCRIPT_TRAILING_SPEECH_TAG.match(context)
+                if trailing:
+                    if segments[-1]["speaker"] is None:
+                        segments[-1]["speaker"] = detect_speaker(
+                            trailing.group(0), trailing.group("subject"), known_speakers
+                        )
+                    context = context[trailing.end() :]
+                context = context.lstrip("，,。.！!？?")
+            if quote is None:
+                add_narration(context)
+                break
+            tag = SCRIPT_SPEECH_TAG.search(context)
+            if tag:
+                add_narration(context[: tag.start("subject")] if tag.group("subject").strip() else context[: tag.start()])
+                add_dialogue(detect_speaker(context, tag.group("subject"), known_speakers), quote.group("text"))
+            else:
+                add_narration(context)
+                add_dialogue(None, quote.group("text"))
+            cursor = quote.end()
+    if narration:
+        segments.append({"speaker": None, "dialogue": None, "scene_description": scene_text()})
+    return segments
+
+
+DERIVATIVE_SIZES = {"thumb_small": 160, "thumb_medium": 480, "preview": 1280}
+
+
+def render_derivatives(source: str, target_dir: str, media_kind: str) -> Dict[str, str]:
+    """Write JPEG thumbnails (and a poster frame for video) of one blob; runs in a worker process.
+
+    Files already present in ``target_dir`` are kept, so re-running for the same
+    content only renders what is missing. Returns derivative name -> file name.
+    """
+    target = Path(target_dir)
+    target.mkdir(parents=True, exist_ok=True)
+    produced: Dict[str, str] = {}
+    image_source = source
+    if media_kind == "video":
+        ffmpeg = shutil.which("ffmpeg")
+        if not ffmpeg:
+            return produced
+        poster = target / "poster.jpg"
+        if not poster.exists():
+            tmp_poster = target / f".{generate_token('tmp', 8)}.jpg"
+            subprocess.run(
+                [ffmpeg, "-loglevel", "error", "-y", "-i", source, "-vf", "thumbnail", "-frames:v", "1", str(tmp_poster)],
+                check=True,
+                timeout=120,
+            )
+            os.replace(tmp_poster, poster)
+        produced["poster"] = poster.name
+        image_source = str(poster)
+    if Image is None:
+        return produced
+    with Image.open(image_source) as opened:
+        image = ImageOps.exif_transpose(opened).convert("RGB")
+    for name, edge in DERIVATIVE_SIZES.items():
+        path = target / f"{name}.jpg"
+        if not path.exists():
+            derivative = image.copy()
+            derivative.thumbnail((edge, edge))
+            tmp_path = target / f".{generate_token('tmp', 8)}.jpg"
+            derivative.save(tmp_path, "JPEG", quality=82, optimize=True)
+            os.replace(tmp_path, path)
+        produced[name] = path.name
+    return produced
+
+
+def extract_script_characters(script: str) -> List[Dict[str, Any]]:
+    """Speakers found in a script with their line counts and first line, in order of appearance."""
+    found: Dict[str, Dict[str, Any]] = {}
+    for segment in split_script(script):
+        speaker = segment["speaker"]
+        if not speaker or not segment["dialogue"]:
+            continue
+        entry = found.setdefault(speaker, {"name": speaker, "lines": 0, "sample_line": segment["dialogue"]})
+        entry["lines"] += 1
+    return list(found.values())
+
+
+GENERATION_CACHE_IGNORED_FIELDS = {"asset_name", "asset_description", "tags"}
+# Only task types the server completes itself can be cached: text_to_image results are reported
+# by clients through PATCH, which must never populate the shared cache.
+CACHEABLE_TASK_TYPES = {"generate_character_images"}
+
+
+def generation_cache_key(organization_id: int, task_type: str, payload: Dict[str, Any]) -> Optional[str]:
+    """Normalized content hash of the inputs that determine a generation result.
+
+    Results are scoped to the organization that produced them and never shared across tenants.
+    """
+    if task_type not in CACHEABLE_TASK_TYPES:
+        return None
+    params: Dict[str, Any] = {}
+    for field, value in payload.items():
+        if field in GENERATION_CACHE_IGNORED_FIELDS or value is None:
+            continue
+        if field == "prompt" and isinstance(value, str):
+            value = " ".join(value.split())
+        elif field == "size" and isinstance(value, str):
+            value = value.strip().upper()
+        params[field] = value
+    return content_hash({"organization_id": organization_id, "task_type": task_type, "params": params})
+
+
 class MockDatabase:
     """Simple in-memory data store backed by JSON."""
 
     def __init__(self, data_path: Path, persist_changes: bool = False):
         self._path = data_path
         self._persist = persist_changes
+        self.generation_cache = LRUCache(GENERATION_CACHE_MAX_ENTRIES, GENERATION_CACHE_MAX_BYTES)
+        self.tts_cache = LRUCache(TTS_CACHE_MAX_ENTRIES, TTS_CACHE_MAX_BYTES)
+        self.archive = ArchiveStore(data_path.parent / "archive")
+        self.metrics = StoreMetrics()
+        self._operation_scanned = 0
         self._load()
 
     def _load(self) -> None:
@@ -118,9 +1685,39 @@ class MockDatabase:
             api_key["id"]: api_key for api_key in raw.get("api_keys", [])
         }
         self.voices: List[Dict[str, Any]] = list(raw.get("voices", []))
-        self.storage_objects: List[Dict[str, Any]] = list(raw.get("storage_objects", []))
-
-        self.tokens: Dict[str, int] = dict(raw.get("tokens", {}))
+        self.voice_catalog = VoiceCatalog(self.voices)
+        self.storage_objects: Dict[str, Dict[str, Any]] = {
+            item["object_key"]: item for item in raw.get("storage_objects", [])
+        }
+        self.storage_objects_by_hash: Dict[str, set[str]] = defaultdict(set)
+        for item in self.storage_objects.values():
+            if item.get("sha256"):
+                self.storage_objects_by_hash[item["sha256"]].add(item["object_key"])
+        # Assets referencing each object key, across all organizations.
+        self._asset_refs: Dict[str, int] = defaultdict(int)
+        for asset in self.assets.values():
+            if asset.get("object_key"):
+                self._asset_refs[asset["object_key"]] += 1
+
+        self.sessions = SessionStore(SESSION_TTL_SECONDS, SESSION_MAX_PER_USER)
+        self.sessions.load(raw.get("sessions", []))
+        # Pre-session data files keep a plain token -> user id map; those start a fresh TTL.
+        for token, user_id in raw.get("tokens", {}).items():
+            self.sessions.add(token, user_id)
+        self.dead_letters: Dict[int, Dict[str, Any]] = {
+            entry["task_id"]: entry for entry in raw.get("dead_letters", [])
+        }
+        self._retry_schedule: List[tuple[float, int]] = [
+            (timestamp_from_utc_iso(task["next_attempt_at"]), task["id"])
+            for task in self.tasks.values()
+            if task["status"] == "retry_scheduled"
+        ]
+        heapq.heapify(self._retry_schedule)
+        self.task_stats = TaskStats()
+        for task in self.tasks.values():
+            self.task_stats.add(task)
+        self.generation_cache.load(raw.get("generation_cache", []))
+        self.tts_cache.load(raw.get("tts_cache", []))
 
         self._counters: Dict[str, int] = {}
         for name, collection in [
@@ -138,11 +1735,13 @@ class MockDatabase:
             ("subscriptions", self.subscriptions),
             ("api_keys", self.api_keys),
         ]:
-            self._counters[name] = (max(collection.keys()) + 1) if collection else 1
+            self._counters[name] = max(max(collection.keys(), default=0), self.archive.max_id(name)) + 1
 
+    @store_operation
     def _dump(self) -> None:
         if not self._persist:
             return
+        started = time.perf_counter()
         payload = {
             "organizations": list(self.organizations.values()),
             "users": list(self.users.values()),
@@ -159,11 +1758,50 @@ class MockDatabase:
             "payments": list(self.payments.values()),
             "api_keys": list(self.api_keys.values()),
             "voices": self.voices,
-            "storage_objects": self.storage_objects,
-            "tokens": self.tokens,
+            "storage_objects": list(self.storage_objects.values()),
+            "sessions": self.sessions.records(),
+            "dead_letters": list(self.dead_letters.values()),
+            "generation_cache": self.generation_cache.records(),
+            "tts_cache": self.tts_cache.records(),
         }
+        self._operation_scanned += sum(len(rows) for rows in payload.values() if isinstance(rows, list))
         with self._path.open("w", encoding="utf-8") as handle:
             json.dump(payload, handle, ensure_ascii=False, indent=2)
+            written = handle.tell()
+        self.metrics.dump_last_seconds = time.perf_counter() - started
+        self.metrics.dump_last_finished = time.monotonic()
+        self.metrics.dump_seconds.observe(self.metrics.dump_last_seconds)
+        self.metrics.dump_bytes_total += written
+        self.metrics.dump_last_bytes = written
+
+    def _scan(self, method: str, collection: Dict[Any, Dict[str, Any]]) -> Iterable[Dict[str, Any]]:
+        """Full-collection iteration for ``method``, counted for ``/metrics``."""
+        self.metrics.scans[method] += 1
+        self.metrics.scanned_rows[method] += len(collection)
+        self._operation_scanned += len(collection)
+        return collection.values()
+
+    def row_counts(self) -> Dict[str, int]:
+        return {
+            "organizations": len(self.organizations),
+            "users": len(self.users),
+            "projects": len(self.projects),
+            "chapters": len(self.chapters),
+            "storyboards": len(self.storyboards),
+            "scenes": len(self.scenes),
+            "characters": len(self.characters),
+            "assets": len(self.assets),
+            "tasks": len(self.tasks),
+            "notifications": len(self.notifications),
+            "plans": len(self.plans),
+            "subscriptions": len(self.subscriptions),
+            "payments": len(self.payments),
+            "api_keys": len(self.api_keys),
+            "voices": len(self.voices),
+            "storage_objects": len(self.storage_objects),
+            "sessions": len(self.sessions),
+            "dead_letters": len(self.dead_letters),
+        }
 
     def _next_id(self, key: str) -> int:
         value = self._counters[key]
@@ -175,91 +1813,311 @@ class MockDatabase:
         data.pop("password", None)
         return data
 
+    @store_operation
     def find_user_by_login(self, credential: str) -> Optional[Dict[str, Any]]:
-        for user in self.users.values():
+        for user in self._scan("find_user_by_login", self.users):
             if credential in {user.get("username"), user.get("email"), user.get("phone")}:
                 return user
         return None
 
+    @store_operation
     def list_users_for_org(self, organization_id: int) -> List[Dict[str, Any]]:
-        return [user for user in self.users.values() if user["organization_id"] == organization_id]
+        return [
+            user
+            for user in self._scan("list_users_for_org", self.users)
+            if user["organization_id"] == organization_id
+        ]
 
+    @store_operation
     def list_projects_for_org(self, organization_id: int) -> List[Dict[str, Any]]:
-        return [project for project in self.projects.values() if project["organization_id"] == organization_id]
+        return [
+            project
+            for project in self._scan("list_projects_for_org", self.projects)
+            if project["organization_id"] == organization_id
+        ]
 
+    @store_operation
     def list_chapters_for_project(self, project_id: int) -> List[Dict[str, Any]]:
-        return [chapter for chapter in self.chapters.values() if chapter["project_id"] == project_id]
+        return [
+            chapter
+            for chapter in self._scan("list_chapters_for_project", self.chapters)
+            if chapter["project_id"] == project_id
+        ]
 
+    @store_operation
     def list_storyboards(
         self, *, project_id: int, chapter_id: Optional[int]
     ) -> List[Dict[str, Any]]:
         return [
             storyboard
-            for storyboard in self.storyboards.values()
+            for storyboard in self._scan("list_storyboards", self.storyboards)
             if storyboard["project_id"] == project_id and storyboard.get("chapter_id") == chapter_id
         ]
 
+    @store_operation
     def list_scenes_for_project(self, project_id: int) -> List[Dict[str, Any]]:
-        return [scene for scene in self.scenes.values() if scene["project_id"] == project_id]
+        return [
+            scene
+            for scene in self._scan("list_scenes_for_project", self.scenes)
+            if scene["project_id"] == project_id
+        ]
 
+    @store_operation
     def list_characters_for_project(self, project_id: int) -> List[Dict[str, Any]]:
-        return [character for character in self.characters.values() if character["project_id"] == project_id]
+        return [
+            character
+            for character in self._scan("list_characters_for_project", self.characters)
+            if character["project_id"] == project_id
+        ]
 
+    @store_operation
     def list_assets_for_org(self, organization_id: int) -> List[Dict[str, Any]]:
-        return [asset for asset in self.assets.values() if asset["organization_id"] == organization_id]
+        return [
+            asset
+            for asset in self._scan("list_assets_for_org", self.assets)
+            if asset["organization_id"] == organization_id
+        ]
 
+    @store_operation
     def list_tasks_for_org(self, organization_id: int) -> List[Dict[str, Any]]:
-        return [task for task in self.tasks.values() if task["organization_id"] == organization_id]
+        return [
+            task
+            for task in self._scan("list_tasks_for_org", self.tasks)
+            if task["organization_id"] == organization_id
+        ]
 
+    @store_operation
     def list_notifications_for_org(self, organization_id: int) -> List[Dict[str, Any]]:
         return [
             notification
-            for notification in self.notifications.values()
+            for notification in self._scan("list_notifications_for_org", self.notifications)
             if notification["organization_id"] == organization_id
         ]
 
+    @store_operation
     def list_api_keys_for_org(self, organization_id: int) -> List[Dict[str, Any]]:
         return [
-            api_key for api_key in self.api_keys.values() if api_key["organization_id"] == organization_id
+            api_key
+            for api_key in self._scan("list_api_keys_for_org", self.api_keys)
+            if api_key["organization_id"] == organization_id
         ]
 
-    def create_task(self, organization_id: int, task_type: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    def create_task(
+        self,
+        organization_id: int,
+        task_type: str,
+        payload: Dict[str, Any],
+        result: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Queue a task, or record it as completed straight away when ``result`` is known."""
         task_id = self._next_id("tasks")
         task = {
             "id": task_id,
             "organization_id": organization_id,
             "task_type": task_type,
-            "status": "queued",
+            "status": "queued" if result is None else "completed",
             "payload": payload,
-            "progress": 0,
-            "result": None,
+            "progress": 0 if result is None else 100,
+            "result": result,
             "error_message": None,
+            "error_code": None,
             "retry_token": None,
+            "attempts": 0,
+            "next_attempt_at": None,
             "created_at": utc_now_iso(),
+            "finished_at": None if result is None else utc_now_iso(),
         }
         self.tasks[task_id] = task
+        self.task_stats.add(task)
         self._dump()
         return task
 
+    def update_task(self, task: Dict[str, Any], fields: Dict[str, Any], cache_result: bool = False) -> Dict[str, Any]:
+        """Apply ``fields`` to ``task``.
+
+        Only pass ``cache_result=True`` for results the server produced itself;
+        client-reported results must never reach the shared generation cache.
+        """
+        previous_status = task["status"]
+        task.update(fields)
+        if fields.get("status") == "failed":
+            # Each failure reports its own code; a retry must not inherit the previous attempt's.
+            task["error_code"] = fields.get("error_code")
+            self._handle_task_failure(task)
+        if "status" in fields:
+            task["finished_at"] = utc_now_iso() if task["status"] in FINISHED_TASK_STATUSES else None
+        if cache_result and task["status"] == "completed" and task.get("result"):
+            cache_key = generation_cache_key(task["organization_id"], task["task_type"], task["payload"])
+            if cache_key and not task["result"].get("cache_hit"):
+                self.generation_cache.put(cache_key, task["result"])
+        self.task_stats.transition(task, previous_status)
+        self._dump()
+        return task
+
+    def _handle_task_failure(self, task: Dict[str, Any]) -> None:
+        """Schedule a backed-off retry, or dead-letter the task once its policy gives up."""
+        policy = RETRY_POLICIES.get(task["task_type"], DEFAULT_RETRY_POLICY)
+        task["attempts"] = task.get("attempts", 0) + 1
+        if policy.should_retry(task["attempts"], task.get("error_code")):
+            due = time.time() + policy.backoff(task["attempts"])
+            task["status"] = "retry_scheduled"
+            task["next_attempt_at"] = utc_iso_from_timestamp(due)
+            heapq.heappush(self._retry_schedule, (due, task["id"]))
+            return
+        task["next_attempt_at"] = None
+        exhausted = task.get("error_code") in policy.retryable_errors
+        self.dead_letters[task["id"]] = {
+            "task_id": task["id"],
+            "organization_id": task["organization_id"],
+            "task_type": task["task_type"],
+            "attempts": task["attempts"],
+            "reason": "exhausted" if exhausted else "non_retryable",
+            "error_code": task.get("error_code"),
+            "error_message": task.get("error_message"),
+            "dead_lettered_at": utc_now_iso(),
+        }
+
+    def release_due_retries(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Move retry-scheduled tasks whose backoff has elapsed back to the queue."""
+        now = time.time() if now is None else now
+        released: List[Dict[str, Any]] = []
+        while self._retry_schedule and self._retry_schedule[0][0] <= now:
+            _, task_id = heapq.heappop(self._retry_schedule)
+            task = self.tasks.get(task_id)
+            # Manual retries and redrives leave stale heap entries behind; skip them.
+            if not task or task["status"] != "retry_scheduled":
+                continue
+            task["status"] = "queued"
+            task["next_attempt_at"] = None
+            self.task_stats.transition(task, "retry_scheduled")
+            released.append(task)
+        if released:
+            self._dump()
+        return released
+
+    def requeue_task(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        previous_status = task["status"]
+        task["status"] = "queued"
+        task["progress"] = 0
+        task["error_message"] = None
+        task["error_code"] = None
+        task["attempts"] = 0
+        task["next_attempt_at"] = None
+        task["finished_at"] = None
+        task["retry_token"] = generate_token("retry")
+        task["created_at"] = utc_now_iso()
+        self.dead_letters.pop(task["id"], None)
+        self.task_stats.transition(task, previous_status)
+        return task
+
+    def expired_records(self, retention_days: float, batch_size: int) -> Dict[str, List[Dict[str, Any]]]:
+        """Finished tasks and notifications older than the retention window, at most ``batch_size`` of each."""
+        cutoff = utc_iso_days_ago(retention_days)
+        expired_tasks: List[Dict[str, Any]] = []
+        for task in self.tasks.values():
+            if len(expired_tasks) >= batch_size:
+                break
+            finished_at = task.get("finished_at") or task["created_at"]
+            if (
+                task["status"] in FINISHED_TASK_STATUSES
+                and finished_at < cutoff
+                and task["id"] not in self.dead_letters
+            ):
+                expired_tasks.append(task)
+        expired_notifications: List[Dict[str, Any]] = []
+        for notification in self.notifications.values():
+            if len(expired_notifications) >= batch_size:
+                break
+            if notification["created_at"] < cutoff:
+                expired_notifications.append(notification)
+        return {"tasks": expired_tasks, "notifications": expired_notifications}
+
+    def drop_archived(self, archived: Dict[str, List[Dict[str, Any]]]) -> None:
+        """Remove records that ``expired_records`` returned and that have since been written to the archive.
+
+        A task retried or deleted while the archive was being written stays as it
+        is; lookups prefer the hot set, so its archived copy is never served.
+        """
+        for task in archived["tasks"]:
+            if self.tasks.get(task["id"]) is not task or task["status"] not in FINISHED_TASK_STATUSES:
+                continue
+            self.task_stats.remove(task)
+            del self.tasks[task["id"]]
+        for notification in archived["notifications"]:
+            self.notifications.pop(notification["id"], None)
+        if archived["tasks"] or archived["notifications"]:
+            self._dump()
+
     def create_asset(self, asset: Dict[str, Any]) -> Dict[str, Any]:
         asset_id = self._next_id("assets")
         asset["id"] = asset_id
         asset.setdefault("created_at", utc_now_iso())
         self.assets[asset_id] = asset
+        if asset.get("object_key"):
+            self._asset_refs[asset["object_key"]] += 1
         self._dump()
         return asset
 
+    def delete_asset(self, asset_id: int) -> Optional[str]:
+        """Delete an asset; return the blob hash it released when nothing references it any more.
+
+        The object record is only dropped when it belongs to the asset's
+        organization and no asset in any organization still points at it.
+        """
+        asset = self.assets.pop(asset_id)
+        orphaned_hash = None
+        object_key = asset.get("object_key")
+        if object_key:
+            self._asset_refs[object_key] -= 1
+            if self._asset_refs[object_key] <= 0:
+                del self._asset_refs[object_key]
+                record = self.storage_objects.get(object_key)
+                if record and record["organization_id"] == asset["organization_id"]:
+                    orphaned_hash = self.remove_storage_object(object_key)
+        self._dump()
+        return orphaned_hash
+
+    @store_operation
     def upsert_storage_object(self, record: Dict[str, Any]) -> None:
-        existing_keys = {item["object_key"] for item in self.storage_objects}
-        if record["object_key"] not in existing_keys:
-            self.storage_objects.append(record)
+        existing = self.storage_objects.get(record["object_key"])
+        if existing is None:
+            self.storage_objects[record["object_key"]] = record
         else:
-            for item in self.storage_objects:
-                if item["object_key"] == record["object_key"]:
-                    item.update(record)
-                    break
+            if existing.get("sha256") and existing["sha256"] != record.get("sha256", existing["sha256"]):
+                self.storage_objects_by_hash[existing["sha256"]].discard(existing["object_key"])
+            existing.update(record)
+        if record.get("sha256"):
+            self.storage_objects_by_hash[record["sha256"]].add(record["object_key"])
         self._dump()
 
+    def organization_owns_object(self, organization_id: int, object_key: str) -> bool:
+        """Uploaded objects belong to the organization on their record; other keys are matched by prefix."""
+        record = self.storage_objects.get(object_key)
+        if record is not None:
+            return record.get("organization_id") == organization_id
+        return object_key.startswith(f"{organization_id}/") or f"/{organization_id}/" in object_key
+
+    def find_storage_object_by_hash(self, sha256: str, organization_id: int) -> Optional[Dict[str, Any]]:
+        for object_key in self.storage_objects_by_hash.get(sha256, ()):
+            record = self.storage_objects[object_key]
+            if record["organization_id"] == organization_id:
+                return record
+        return None
+
+    def remove_storage_object(self, object_key: str) -> Optional[str]:
+        """Drop an object record; return its content hash if no other object shares the blob."""
+        record = self.storage_objects.pop(object_key, None)
+        if not record or not record.get("sha256"):
+            return None
+        sha256 = record["sha256"]
+        keys = self.storage_objects_by_hash.get(sha256)
+        if keys is not None:
+            keys.discard(object_key)
+            if keys:
+                return None
+            del self.storage_objects_by_hash[sha256]
+        return sha256
+
 
 class RegisterRequest(BaseModel):
     email: str
@@ -365,6 +2223,18 @@ class TaskCreateRequest(BaseModel):
     payload: Dict[str, Any]
 
 
+class TaskUpdateRequest(BaseModel):
+    status: Optional[str] = None
+    progress: Optional[int] = Field(default=None, ge=0, le=100)
+    result: Optional[Dict[str, Any]] = None
+    error_message: Optional[str] = None
+    error_code: Optional[str] = None
+
+
+class DeadLetterRedriveRequest(BaseModel):
+    task_ids: Optional[List[int]] = None
+
+
 class TextToImageRequest(BaseModel):
     prompt: str
     size: Optional[str] = "2K"
@@ -402,6 +2272,7 @@ class PlanCreateRequest(BaseModel):
     max_storyboards: Optional[int] = None
     storage_gb: Optional[int] = 10
     is_active: Optional[int] = 1
+    rate_limits: Optional[Dict[str, Dict[str, float]]] = None
 
 
 class PlanUpdateRequest(BaseModel):
@@ -414,6 +2285,7 @@ class PlanUpdateRequest(BaseModel):
     max_storyboards: Optional[int] = None
     storage_gb: Optional[int] = None
     is_active: Optional[int] = None
+    rate_limits: Optional[Dict[str, Dict[str, float]]] = None
 
 
 class PaymentCreateRequest(BaseModel):
@@ -421,6 +2293,17 @@ class PaymentCreateRequest(BaseModel):
     amount: int
 
 
+class MultipartUploadCreateRequest(BaseModel):
+    filename: str
+    content_type: Optional[str] = None
+
+
+class InstantUploadRequest(BaseModel):
+    sha256: str
+    filename: str
+    content_type: Optional[str] = None
+
+
 class ApiKeyCreateRequest(BaseModel):
     name: str
     value: str
@@ -446,12 +2329,174 @@ class TtsSynthesizeRequest(BaseModel):
     extra_parameters: Optional[Dict[str, Any]] = None
 
 
-DATA_PATH = Path(__file__).resolve().parent / "mock_data" / "data.json"
+class TtsBatchRequest(BaseModel):
+    voice_type: Optional[str] = None
+    emotion: Optional[str] = None
+    volume: Optional[float] = 1.0
+    sample_rate: Optional[int] = 24000
+    audio_format: Optional[str] = "mp3"
+    concurrency: int = Field(default=4, ge=1, le=16)
+
+
+DATA_PATH = Path(os.getenv("MOCK_DATA_PATH") or Path(__file__).resolve().parent / "mock_data" / "data.json")
 PERSIST_CHANGES = os.getenv("MOCK_PERSIST_CHANGES", "false").lower() in {"1", "true", "yes"}
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("MOCK_IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("MOCK_IDEMPOTENCY_MAX_ENTRIES", "10000"))
+IN_FLIGHT_TASK_STATUSES = {"queued", "running", "retry_scheduled"}
+FINISHED_TASK_STATUSES = {"completed", "failed"}
+# retry_scheduled is set by the failure handler, which also schedules next_attempt_at.
+CLIENT_SETTABLE_TASK_STATUSES = {"queued", "running", "completed", "failed"}
+GENERATION_CACHE_MAX_ENTRIES = int(os.getenv("MOCK_GENERATION_CACHE_MAX_ENTRIES", "5000"))
+GENERATION_CACHE_MAX_BYTES = int(os.getenv("MOCK_GENERATION_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+SESSION_TTL_SECONDS = float(os.getenv("MOCK_SESSION_TTL_SECONDS", str(7 * 86400)))
+SESSION_MAX_PER_USER = int(os.getenv("MOCK_SESSION_MAX_PER_USER", "10"))
+SESSION_SWEEP_INTERVAL_SECONDS = float(os.getenv("MOCK_SESSION_SWEEP_INTERVAL_SECONDS", "60"))
+RATE_LIMIT_ENABLED = os.getenv("MOCK_RATE_LIMIT_ENABLED", "true").lower() in {"1", "true", "yes"}
+# plan_type -> route class -> {"per_minute", "burst"}; organizations without a subscription use "free".
+RATE_LIMITS: Dict[str, Dict[str, Dict[str, float]]] = {
+    "free": {
+        "video_generation": {"per_minute": 2, "burst": 2},
+        "image_generation": {"per_minute": 10, "burst": 5},
+        "tts": {"per_minute": 30, "burst": 10},
+    },
+    "basic": {
+        "video_generation": {"per_minute": 6, "burst": 3},
+        "image_generation": {"per_minute": 30, "burst": 10},
+        "tts": {"per_minute": 60, "burst": 20},
+    },
+    "pro": {
+        "video_generation": {"per_minute": 30, "burst": 10},
+        "image_generation": {"per_minute": 120, "burst": 30},
+        "tts": {"per_minute": 300, "burst": 60},
+    },
+}
+# Overrides are merged per key over the built-in limits (or the free plan's, for a new plan_type) and
+# checked here, so a bad MOCK_RATE_LIMITS fails at startup instead of on the first limited request.
+for _plan_type, _overrides in json.loads(os.getenv("MOCK_RATE_LIMITS", "{}")).items():
+    validate_rate_limits(_overrides, complete=False)
+    RATE_LIMITS[_plan_type] = merge_rate_limits(RATE_LIMITS.get(_plan_type, RATE_LIMITS["free"]), _overrides)
+for _limits in RATE_LIMITS.values():
+    validate_rate_limits(_limits)
+ORG_PLAN_CACHE_TTL_SECONDS = 30
+METRICS_ENABLED = os.getenv("MOCK_METRICS_ENABLED", "true").lower() in {"1", "true", "yes"}
+PROFILING_ENABLED = os.getenv("MOCK_PROFILING_ENABLED", "false").lower() in {"1", "true", "yes"}
+PROFILE_MAX_ENTRIES = int(os.getenv("MOCK_PROFILE_MAX_ENTRIES", "20"))
+PROFILE_TTL_SECONDS = float(os.getenv("MOCK_PROFILE_TTL_SECONDS", "3600"))
+PROFILE_REPORT_LINES = 80
+SLOW_OPERATION_THRESHOLD_MS = float(os.getenv("MOCK_SLOW_OPERATION_THRESHOLD_MS", "50"))
+SLOW_LOG_PATH = os.getenv("MOCK_SLOW_LOG_PATH", "")
+# Readiness thresholds; a value of 0 turns the check off.
+READY_MAX_LOOP_LAG_SECONDS = float(os.getenv("MOCK_READY_MAX_LOOP_LAG_SECONDS", "0.25"))
+READY_LOOP_LAG_WINDOW_SECONDS = float(os.getenv("MOCK_READY_LOOP_LAG_WINDOW_SECONDS", "10"))
+READY_MAX_DUMP_SECONDS = float(os.getenv("MOCK_READY_MAX_DUMP_SECONDS", "2"))
+READY_MAX_QUEUED_TASKS = int(os.getenv("MOCK_READY_MAX_QUEUED_TASKS", "10000"))
+READY_MAX_RSS_BYTES = int(float(os.getenv("MOCK_READY_MAX_RSS_MB", "0")) * 1024 * 1024)
+LIVE_MAX_STALL_SECONDS = float(os.getenv("MOCK_LIVE_MAX_STALL_SECONDS", "30"))
+TASK_RETENTION_DAYS = float(os.getenv("MOCK_TASK_RETENTION_DAYS", "30"))
+COMPACTION_INTERVAL_SECONDS = float(os.getenv("MOCK_COMPACTION_INTERVAL_SECONDS", "3600"))
+COMPACTION_BATCH_SIZE = int(os.getenv("MOCK_COMPACTION_BATCH_SIZE", "5000"))
+RETRY_SCHEDULER_INTERVAL_SECONDS = float(os.getenv("MOCK_RETRY_SCHEDULER_INTERVAL_SECONDS", "1"))
+WORKFLOW_EVENT_DELAY_SECONDS = float(os.getenv("MOCK_WORKFLOW_EVENT_DELAY_SECONDS", "0"))
+WORKFLOW_STREAM_BUFFER = int(os.getenv("MOCK_WORKFLOW_STREAM_BUFFER", "16"))
+SSE_KEEPALIVE_SECONDS = float(os.getenv("MOCK_SSE_KEEPALIVE_SECONDS", "15"))
+OBJECT_STORE_DIR = Path(os.getenv("MOCK_OBJECT_STORE_DIR", str(DATA_PATH.parent / "objects")))
+UPLOAD_CHUNK_SIZE = int(os.getenv("MOCK_UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MULTIPART_MAX_PARTS = 10000
+TTS_CACHE_MAX_ENTRIES = int(os.getenv("MOCK_TTS_CACHE_MAX_ENTRIES", "20000"))
+TTS_CACHE_MAX_BYTES = int(os.getenv("MOCK_TTS_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+TTS_SYNTHESIS_DELAY_SECONDS = float(os.getenv("MOCK_TTS_SYNTHESIS_DELAY_SECONDS", "0"))
+TTS_SECONDS_PER_CHARACTER = 0.25
+TTS_MAX_TEXT_CHARS = int(os.getenv("MOCK_TTS_MAX_TEXT_CHARS", "2000"))
+TTS_STREAM_CHUNK_BYTES = int(os.getenv("MOCK_TTS_STREAM_CHUNK_BYTES", str(16 * 1024)))
+TTS_JOB_TTL_SECONDS = float(os.getenv("MOCK_TTS_JOB_TTL_SECONDS", "300"))
+TTS_JOB_MAX_ENTRIES = int(os.getenv("MOCK_TTS_JOB_MAX_ENTRIES", "200"))
+TTS_JOB_MAX_BYTES = int(os.getenv("MOCK_TTS_JOB_MAX_BYTES", str(64 * 1024 * 1024)))
+VOICE_CATALOG_MAX_AGE_SECONDS = int(os.getenv("MOCK_VOICE_CATALOG_MAX_AGE_SECONDS", "86400"))
+SCRIPT_SPLIT_PARALLEL_THRESHOLD = int(os.getenv("MOCK_SCRIPT_SPLIT_PARALLEL_THRESHOLD", "20000"))
+PROCESS_POOL_WORKERS = int(os.getenv("MOCK_PROCESS_POOL_WORKERS", str(os.cpu_count() or 2)))
+SCRIPT_SPLIT_CACHE_MAX_ENTRIES = int(os.getenv("MOCK_SCRIPT_SPLIT_CACHE_MAX_ENTRIES", "256"))
+SCRIPT_SPLIT_CACHE_MAX_BYTES = int(os.getenv("MOCK_SCRIPT_SPLIT_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+CHARACTER_EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("MOCK_CHARACTER_EXTRACTION_CACHE_MAX_ENTRIES", "1024"))
+PASSWORD_HASH_WORKERS = int(os.getenv("MOCK_PASSWORD_HASH_WORKERS", "4"))
+LOGIN_MAX_CONCURRENCY = int(os.getenv("MOCK_LOGIN_MAX_CONCURRENCY", "8"))
+LOGIN_QUEUE_TIMEOUT_SECONDS = float(os.getenv("MOCK_LOGIN_QUEUE_TIMEOUT_SECONDS", "5"))
+LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("MOCK_LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+PRESIGN_SECRET = os.getenv("MOCK_PRESIGN_SECRET", "")
+PRESIGN_DEFAULT_EXPIRES_SECONDS = 3600
+PRESIGN_MAX_EXPIRES_SECONDS = 7 * 24 * 3600
+DEFAULT_RETRY_POLICY = RetryPolicy()
+RETRY_POLICIES: Dict[str, RetryPolicy] = {
+    "text_to_image": RetryPolicy(max_attempts=4),
+    "generate_character_images": RetryPolicy(max_attempts=4),
+    "generate_storyboard_images": RetryPolicy(max_attempts=4, base_delay=5.0, max_delay=120.0),
+    "generate_storyboard_keyframes": RetryPolicy(max_attempts=4, base_delay=5.0, max_delay=120.0),
+    "generate_storyboard_videos": RetryPolicy(max_attempts=5, base_delay=15.0, max_delay=600.0),
+}
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="Mock Service", version="1.0.0")
+    background_jobs: List[Callable[[], Awaitable[None]]] = []
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        running = [asyncio.create_task(job()) for job in background_jobs]
+        try:
+            yield
+        finally:
+            for job in running:
+                job.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            if app.state.process_pool is not None:
+                app.state.process_pool.shutdown(wait=False, cancel_futures=True)
+            app.state.password_executor.shutdown(wait=False, cancel_futures=True)
+            app.state.slow_log_listener.stop()
+
+    app = FastAPI(title="Mock Service", version="1.0.0", lifespan=lifespan)
+    app.state.process_pool = None
+
+    def process_pool() -> ProcessPoolExecutor:
+        """Worker processes for CPU-bound jobs, started on first use."""
+        if app.state.process_pool is None:
+            app.state.process_pool = ProcessPoolExecutor(max_workers=PROCESS_POOL_WORKERS)
+        return app.state.process_pool
+
+    rate_limiter = TokenBucketLimiter()
+    app.state.rate_limiter = rate_limiter
+    request_metrics = RequestMetrics()
+    app.state.request_metrics = request_metrics
+    profiles = TTLCache(PROFILE_MAX_ENTRIES, PROFILE_TTL_SECONDS)
+    app.state.profiles = profiles
+    org_plans = TTLCache(10000, ORG_PLAN_CACHE_TTL_SECONDS)
+
+    def plan_for_org(organization_id: int) -> Optional[Dict[str, Any]]:
+        missing = object()
+        plan = org_plans.get(organization_id, missing)
+        if plan is missing:
+            active = [
+                subscription
+                for subscription in store.subscriptions.values()
+                if subscription["organization_id"] == organization_id and subscription.get("status") == "active"
+            ]
+            latest = max(active, key=lambda item: item["id"], default=None)
+            plan = store.plans.get(latest["plan_id"]) if latest else None
+            org_plans.set(organization_id, plan)
+        return plan
+
+    def resolve_rate_limit(scope: Dict[str, Any], route_class: str) -> Optional[tuple]:
+        auth_header = Request(scope).headers.get("authorization", "")
+        if not auth_header.startswith("Bearer "):
+            return None
+        user = store.users.get(store.sessions.get(auth_header.split(" ", 1)[1].strip()))
+        if not user:
+            return None
+        limit = rate_limits_for_plan(plan_for_org(user["organization_id"])).get(route_class)
+        if not limit:
+            return None
+        return user["organization_id"], limit["per_minute"], limit["burst"]
+
+    # Added before CORS so that CORS stays outermost and 429s still carry its headers.
+    if RATE_LIMIT_ENABLED:
+        app.add_middleware(RateLimitMiddleware, limiter=rate_limiter, resolve_limit=resolve_rate_limit)
 
     if os.getenv("MOCK_ALLOW_CORS", "true").lower() in {"1", "true", "yes"}:
         app.add_middleware(
@@ -462,8 +2507,109 @@ def create_app() -> FastAPI:
             allow_headers=["*"],
         )
 
+    def resolve_profiling_admin(scope: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        auth_header = Request(scope).headers.get("authorization", "")
+        if not auth_header.startswith("Bearer "):
+            return None
+        user = store.users.get(store.sessions.get(auth_header.split(" ", 1)[1].strip()))
+        return user if user and user.get("role") == "admin" else None
+
+    # Not installed at all unless enabled, so ordinary requests pay nothing for it.
+    if PROFILING_ENABLED:
+        app.add_middleware(ProfilingMiddleware, artifacts=profiles, resolve_admin=resolve_profiling_admin)
+
+    # Outermost, so the timings include CORS handling and rate-limit rejections.
+    if METRICS_ENABLED:
+        app.add_middleware(MetricsMiddleware, metrics=request_metrics)
+
+    app.state.slow_log_listener = start_slow_log(SLOW_LOG_PATH)
     store = MockDatabase(DATA_PATH, persist_changes=PERSIST_CHANGES)
     app.state.store = store
+    idempotency_cache = TTLCache(IDEMPOTENCY_MAX_ENTRIES, IDEMPOTENCY_TTL_SECONDS)
+    app.state.idempotency_cache = idempotency_cache
+    object_store = LocalObjectStore(OBJECT_STORE_DIR, UPLOAD_CHUNK_SIZE)
+    app.state.object_store = object_store
+    # Running jobs are never evicted; they move to the bounded, expiring cache once they finish.
+    running_tts_jobs: Dict[str, TtsJob] = {}
+    tts_jobs = TTLCache(TTS_JOB_MAX_ENTRIES, TTS_JOB_TTL_SECONDS)
+    tts_job_runners: set[asyncio.Task] = set()
+    # Without a configured secret, presigned URLs only stay valid for this process.
+    presign_secret = (PRESIGN_SECRET or secrets.token_hex(32)).encode("utf-8")
+    workflow_metrics: Dict[str, Any] = {
+        "streams_started": 0,
+        "streams_completed": 0,
+        "streams_cancelled": 0,
+        "time_to_first_event": Histogram(),
+    }
+    app.state.workflow_metrics = workflow_metrics
+    # Password hashing is CPU-bound; hashlib releases the GIL, so a small thread
+    # pool keeps it off the event loop without a process hop.
+    password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password")
+    app.state.password_executor = password_executor
+    login_slots = asyncio.Semaphore(LOGIN_MAX_CONCURRENCY)
+    login_metrics: Dict[str, Any] = {
+        "attempts": 0,
+        "succeeded": 0,
+        "failed": 0,
+        "rejected": 0,
+        "rehashed": 0,
+        "in_progress": 0,
+        "verify_seconds": Histogram(),
+    }
+    loop_lag = Histogram(LOOP_LAG_BUCKETS)
+    app.state.loop_lag = loop_lag
+    app.state.loop_lag_last = 0.0
+    # Samples covering the readiness window, so one old stall does not keep a worker out forever.
+    loop_lag_recent: deque[float] = deque(
+        maxlen=max(1, math.ceil(READY_LOOP_LAG_WINDOW_SECONDS / LOOP_LAG_INTERVAL_SECONDS))
+    )
+    app.state.loop_lag_heartbeat = None
+
+    async def run_loop_lag_monitor() -> None:
+        # How late a timer fires is how long the loop was blocked by other work.
+        while True:
+            app.state.loop_lag_heartbeat = time.monotonic()
+            started = time.perf_counter()
+            await asyncio.sleep(LOOP_LAG_INTERVAL_SECONDS)
+            lag = max(0.0, time.perf_counter() - started - LOOP_LAG_INTERVAL_SECONDS)
+            loop_lag.observe(lag)
+            loop_lag_recent.append(lag)
+            app.state.loop_lag_last = lag
+
+    background_jobs.append(run_loop_lag_monitor)
+
+    async def run_session_sweeper() -> None:
+        while True:
+            await asyncio.sleep(SESSION_SWEEP_INTERVAL_SECONDS)
+            if store.sessions.sweep():
+                store._dump()
+
+    background_jobs.append(run_session_sweeper)
+
+    async def run_password_job(func: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(password_executor, func, *args)
+
+    async def run_compactor() -> None:
+        while True:
+            await asyncio.sleep(COMPACTION_INTERVAL_SECONDS)
+            expired = store.expired_records(TASK_RETENTION_DAYS, COMPACTION_BATCH_SIZE)
+            # Serializing and gzipping the batch runs in a thread, on copies so that a concurrent
+            # update cannot change a record mid-write; the manifest and hot set change only here.
+            for collection, records in expired.items():
+                written = await asyncio.to_thread(store.archive.write, collection, [dict(record) for record in records])
+                store.archive.commit(collection, written)
+            store.drop_archived(expired)
+
+    # Archived history only makes sense when the hot set is persisted as well.
+    if PERSIST_CHANGES and TASK_RETENTION_DAYS > 0:
+        background_jobs.append(run_compactor)
+
+    async def run_retry_scheduler() -> None:
+        while True:
+            await asyncio.sleep(RETRY_SCHEDULER_INTERVAL_SECONDS)
+            store.release_due_retries()
+
+    background_jobs.append(run_retry_scheduler)
 
     async def get_store(request: Request) -> MockDatabase:
         return request.app.state.store  # type: ignore[attr-defined]
@@ -475,7 +2621,7 @@ def create_app() -> FastAPI:
         if not auth_header or not auth_header.startswith("Bearer "):
             raise HTTPException(status_code=401, detail="Not authenticated")
         token = auth_header.split(" ", 1)[1].strip()
-        user_id = store.tokens.get(token)
+        user_id = store.sessions.get(token)
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid token")
         user = store.users.get(user_id)
@@ -507,6 +2653,13 @@ def create_app() -> FastAPI:
         uploader = store.users.get(asset.get("uploaded_by_id"))
         if uploader:
             data["uploaded_by"] = store.public_user(uploader)
+        record = store.storage_objects.get(asset.get("object_key") or "")
+        derivatives = (record or {}).get("derivatives") or {}
+        data["derivatives"] = {
+            name: signed_derivative_url(record["sha256"], filename) for name, filename in derivatives.items()
+        }
+        if record and record.get("derivatives_error"):
+            data["derivatives_error"] = record["derivatives_error"]
         return data
 
     def serialize_task(task: Dict[str, Any]) -> Dict[str, Any]:
@@ -516,10 +2669,242 @@ def create_app() -> FastAPI:
     def serialize_notification(notification: Dict[str, Any]) -> Dict[str, Any]:
         return dict(notification)
 
+    def mark_replayed(response: Response) -> None:
+        response.status_code = 200
+        response.headers["Idempotent-Replayed"] = "true"
+
+    def create_task_once(
+        request: Request,
+        response: Response,
+        current_user: Dict[str, Any],
+        task_type: str,
+        payload: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        """Create a task unless an Idempotency-Key or identical in-flight payload already did."""
+        organization_id = current_user["organization_id"]
+        fingerprint = content_hash({"task_type": task_type, "payload": payload})
+        idempotency_key = request.headers.get("Idempotency-Key")
+        if idempotency_key:
+            cached = idempotency_cache.get((organization_id, "key", idempotency_key))
+            if cached:
+                task_id, cached_fingerprint = cached
+                if cached_fingerprint != fingerprint:
+                    raise HTTPException(status_code=422, detail="Idempotency-Key reused with a different payload")
+                task = store.tasks.get(task_id)
+                if task:
+                    mark_replayed(response)
+                    return task
+        task_id = idempotency_cache.get((organization_id, "hash", fingerprint))
+        task = store.tasks.get(task_id) if task_id else None
+        if task and task["status"] in IN_FLIGHT_TASK_STATUSES:
+            mark_replayed(response)
+        else:
+            cache_key = generation_cache_key(organization_id, task_type, payload)
+            cached = store.generation_cache.get(cache_key) if cache_key else None
+            result = {**cached, "cache_hit": True} if cached else None
+            task = store.create_task(organization_id, task_type, payload, result=result)
+            idempotency_cache.set((organization_id, "hash", fingerprint), task["id"])
+        if idempotency_key:
+            idempotency_cache.set((organization_id, "key", idempotency_key), (task["id"], fingerprint))
+        return task
+
     @app.get("/health")
     async def health() -> Dict[str, str]:
         return {"status": "ok"}
 
+    @app.get("/health/live")
+    async def health_live() -> JSONResponse:
+        heartbeat = app.state.loop_lag_heartbeat
+        # No heartbeat means the monitor is not running (no lifespan); there is nothing to judge by.
+        stalled_for = None if heartbeat is None else time.monotonic() - heartbeat - LOOP_LAG_INTERVAL_SECONDS
+        alive = stalled_for is None or LIVE_MAX_STALL_SECONDS <= 0 or stalled_for <= LIVE_MAX_STALL_SECONDS
+        return JSONResponse(
+            {
+                "status": "ok" if alive else "stalled",
+                "loop_monitor_stalled_seconds": None if stalled_for is None else round(max(0.0, stalled_for), 3),
+                "event_loop_lag_seconds": round(app.state.loop_lag_last, 4),
+            },
+            status_code=200 if alive else 503,
+        )
+
+    @app.get("/health/ready")
+    async def health_ready() -> JSONResponse:
+        def check(value: Optional[float], threshold: float) -> Dict[str, Any]:
+            ok = threshold <= 0 or value is None or value <= threshold
+            return {"ok": ok, "value": value, "threshold": threshold or None}
+
+        recent_lag = max(loop_lag_recent, default=0.0)
+        # Same window as the lag check: a worker taken out of rotation gets no writes,
+        # so a sticky "last dump" value would keep it out forever.
+        last_finished = store.metrics.dump_last_finished
+        recent_dump = (
+            store.metrics.dump_last_seconds
+            if last_finished is not None and time.monotonic() - last_finished <= READY_LOOP_LAG_WINDOW_SECONDS
+            else 0.0
+        )
+        task_totals = store.task_stats.status_totals()
+        waiting_tasks = task_totals.get("queued", 0) + task_totals.get("retry_scheduled", 0)
+        rss = process_rss_bytes()
+        checks = {
+            "event_loop_lag": check(round(recent_lag, 4), READY_MAX_LOOP_LAG_SECONDS),
+            "persistence": check(round(recent_dump, 4), READY_MAX_DUMP_SECONDS),
+            "task_queue": check(waiting_tasks, READY_MAX_QUEUED_TASKS),
+            "rss": check(rss, READY_MAX_RSS_BYTES),
+        }
+        ready = all(item["ok"] for item in checks.values())
+        return JSONResponse(
+            {
+                "status": "ready" if ready else "not_ready",
+                "failing": [name for name, item in checks.items() if not item["ok"]],
+                "checks": checks,
+                "event_loop_lag_seconds": {
+                    **loop_lag.summary(),
+                    "last": round(app.state.loop_lag_last, 4),
+                    "recent_max": round(recent_lag, 4),
+                },
+                "persistence": {
+                    "enabled": PERSIST_CHANGES,
+                    "last_dump_seconds": round(store.metrics.dump_last_seconds, 4),
+                    "last_dump_bytes": store.metrics.dump_last_bytes,
+                    "pending_derivative_jobs": len(derivative_jobs),
+                    "slow_log_backlog": app.state.slow_log_listener.queue.qsize(),
+                },
+                "task_queue": {
+                    status: task_totals.get(status, 0) for status in ("queued", "running", "retry_scheduled")
+                },
+                "memory": {"rss_bytes": rss},
+                "collections": store.row_counts(),
+            },
+            status_code=200 if ready else 503,
+        )
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics() -> Response:
+        if not METRICS_ENABLED:
+            raise HTTPException(status_code=404, detail="Not Found")
+        exposition = PrometheusExposition()
+        exposition.metric(
+            "mock_http_requests_total",
+            "counter",
+            "HTTP requests by method, route template and status.",
+            (
+                ({"method": method, "route": route, "status": status}, count)
+                for (method, route, status), count in sorted(request_metrics.requests.items())
+            ),
+        )
+        exposition.histogram(
+            "mock_http_request_duration_seconds",
+            "HTTP request latency by method and route template.",
+            (
+                ({"method": method, "route": route}, histogram)
+                for (method, route), histogram in sorted(request_metrics.durations.items())
+            ),
+        )
+        exposition.metric(
+            "mock_http_requests_in_flight",
+            "gauge",
+            "HTTP requests currently being served.",
+            [({}, request_metrics.in_flight)],
+        )
+        exposition.histogram(
+            "mock_store_dump_duration_seconds",
+            "Time spent writing the data file.",
+            [({}, store.metrics.dump_seconds)],
+        )
+        exposition.metric(
+            "mock_store_dump_bytes_total",
+            "counter",
+            "Bytes written to the data file.",
+            [({}, store.metrics.dump_bytes_total)],
+        )
+        exposition.metric(
+            "mock_store_dump_last_bytes",
+            "gauge",
+            "Size of the most recent data file write.",
+            [({}, store.metrics.dump_last_bytes)],
+        )
+        exposition.metric(
+            "mock_store_rows",
+            "gauge",
+            "Rows held in memory per collection.",
+            (({"collection": name}, count) for name, count in store.row_counts().items()),
+        )
+        exposition.metric(
+            "mock_store_scans_total",
+            "counter",
+            "Full-collection scans by store method.",
+            (({"method": method}, count) for method, count in sorted(store.metrics.scans.items())),
+        )
+        exposition.metric(
+            "mock_store_scanned_rows_total",
+            "counter",
+            "Rows visited by full-collection scans, by store method.",
+            (({"method": method}, count) for method, count in sorted(store.metrics.scanned_rows.items())),
+        )
+        exposition.histogram(
+            "mock_store_operation_duration_seconds",
+            "Store method latency by operation.",
+            (({"operation": name}, histogram) for name, histogram in sorted(store.metrics.operation_seconds.items())),
+        )
+        exposition.metric(
+            "mock_store_operation_returned_rows_total",
+            "counter",
+            "Rows returned by store methods, by operation.",
+            (({"operation": name}, count) for name, count in sorted(store.metrics.returned_rows.items())),
+        )
+        exposition.metric(
+            "mock_store_slow_operations_total",
+            "counter",
+            "Store method calls over the slow-log threshold, by operation.",
+            (({"operation": name}, count) for name, count in sorted(store.metrics.slow_operations.items())),
+        )
+        exposition.histogram(
+            "mock_event_loop_lag_seconds",
+            "How late the event loop ran a periodic timer.",
+            [({}, loop_lag)],
+        )
+        exposition.metric("mock_sessions_active", "gauge", "Unexpired login sessions.", [({}, len(store.sessions))])
+        limiter_stats = rate_limiter.stats()
+        exposition.metric(
+            "mock_rate_limit_decisions_total",
+            "counter",
+            "Rate limiter decisions by route class and outcome.",
+            [
+                ({"route_class": name, "outcome": outcome}, count)
+                for outcome in ("allowed", "rejected")
+                for name, count in sorted(limiter_stats[outcome].items())
+            ],
+        )
+        return Response(exposition.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    @app.get("/api/profiles")
+    async def list_profiles(current_user: Dict[str, Any] = Depends(get_current_user)):
+        ensure_admin(current_user)
+        artifacts = [
+            {key: value for key, value in artifact.items() if key not in {"pstats", "report"}}
+            for artifact in profiles.values()
+            if artifact["organization_id"] == current_user["organization_id"]
+        ]
+        return sorted(artifacts, key=lambda artifact: artifact["created_at"], reverse=True)
+
+    @app.get("/api/profiles/{profile_id}")
+    async def download_profile(
+        profile_id: str,
+        format: str = Query("pstats", pattern="^(pstats|text)$"),
+        current_user: Dict[str, Any] = Depends(get_current_user),
+    ):
+        ensure_admin(current_user)
+        artifact = profiles.get(profile_id)
+        if not artifact or artifact["organization_id"] != current_user["organization_id"]:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        if format == "text":
+            return Response(artifact["report"], media_type="text/plain; charset=utf-8")
+        return Response(
+            artifact["pstats"],
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.prof"'},
+        )
+
     # Authentication ----------------------------------------------------------------
 
     @app.post("/api/auth/register")
@@ -546,12 +2931,12 @@ def create_app() -> FastAPI:
             "role": "admin",
             "organization_id": organization_id,
             "is_active": True,
-            "password": payload.password,
+            "password": await run_password_job(hash_password, payload.password),
             "created_at": utc_now_iso(),
         }
         store.users[user_id] = user
         token = generate_token("mock-token")
-        store.tokens[token] = user_id
+        store.sessions.add(token, user_id)
         store._dump()
 
         return {"token": token, "user": store.public_user(user)}
@@ -561,19 +2946,57 @@ def create_app() -> FastAPI:
         form_data: OAuth2PasswordRequestForm = Depends(),
         store: MockDatabase = Depends(get_store),
     ):
-        user = store.find_user_by_login(form_data.username)
-        if not user or not verify_password(form_data.password, user.get("password")):
-            raise HTTPException(status_code=400, detail="Invalid credentials")
-        if not user.get("is_active", True):
-            raise HTTPException(status_code=400, detail="User is inactive")
-        existing_token = next((token for token, uid in store.tokens.items() if uid == user["id"]), None)
-        if existing_token:
-            token = existing_token
-        else:
-            token = generate_token("mock-token")
-            store.tokens[token] = user["id"]
+        login_metrics["attempts"] += 1
+        try:
+            await asyncio.wait_for(login_slots.acquire(), timeout=LOGIN_QUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            login_metrics["rejected"] += 1
+            raise HTTPException(
+                status_code=503, detail="Too many concurrent logins, retry shortly", headers={"Retry-After": "1"}
+            )
+        login_metrics["in_progress"] += 1
+        try:
+            user = store.find_user_by_login(form_data.username)
+            started = time.perf_counter()
+            valid = bool(user) and await run_password_job(verify_password, form_data.password, user.get("password"))
+            login_metrics["verify_seconds"].observe(time.perf_counter() - started)
+            if not valid:
+                login_metrics["failed"] += 1
+                raise HTTPException(status_code=400, detail="Invalid credentials")
+            if not user.get("is_active", True):
+                login_metrics["failed"] += 1
+                raise HTTPException(status_code=400, detail="User is inactive")
+            if password_needs_rehash(user["password"]):
+                user["password"] = await run_password_job(hash_password, form_data.password)
+                login_metrics["rehashed"] += 1
+                store._dump()
+        finally:
+            login_metrics["in_progress"] -= 1
+            login_slots.release()
+        login_metrics["succeeded"] += 1
+        token = generate_token("mock-token")
+        store.sessions.add(token, user["id"])
+        store._dump()
         return {"token": token, "user": store.public_user(user)}
 
+    @app.get("/api/auth/login/metrics")
+    async def login_metrics_endpoint(
+        current_user: Dict[str, Any] = Depends(get_current_user),
+    ):
+        ensure_admin(current_user)
+        return {
+            **{key: value for key, value in login_metrics.items() if key != "verify_seconds"},
+            "verify_seconds": login_metrics["verify_seconds"].summary(),
+            "event_loop_lag_seconds": {**loop_lag.summary(), "last": round(app.state.loop_lag_last, 4)},
+            "sessions": store.sessions.stats(),
+        }
+
+    @app.post("/api/auth/logout", status_code=204, response_class=Response)
+    async def logout(request: Request, current_user: Dict[str, Any] = Depends(get_current_user)):
+        if store.sessions.revoke(request.headers["Authorization"].split(" ", 1)[1].strip()):
+            store._dump()
+        return Response(status_code=204)
+
     @app.get("/api/auth/me")
     async def auth_me(current_user: Dict[str, Any] = Depends(get_current_user)):
         return store.public_user(current_user)
@@ -615,7 +3038,7 @@ def create_app() -> FastAPI:
             "role": payload.role or "editor",
             "organization_id": current_user["organization_id"],
             "is_active": True,
-            "password": payload.password,
+            "password": await run_password_job(hash_password, payload.password),
             "created_at": utc_now_iso(),
         }
         store.users[user_id] = user
@@ -652,7 +3075,7 @@ def create_app() -> FastAPI:
         if not target or target["organization_id"] != current_user["organization_id"]:
             raise HTTPException(status_code=404, detail="User not found")
         del store.users[user_id]
-        store.tokens = {token: uid for token, uid in store.tokens.items() if uid != user_id}
+        store.sessions.revoke_user(user_id)
         store._dump()
         return Response(status_code=204)
 
@@ -852,43 +3275,177 @@ def create_app() -> FastAPI:
         store._dump()
         return Response(status_code=204)
 
+    split_cache = LRUCache(SCRIPT_SPLIT_CACHE_MAX_ENTRIES, SCRIPT_SPLIT_CACHE_MAX_BYTES)
+
+    async def run_script_job(func: Callable[..., Any], script: str, *args: Any, batch_chars: int = 0) -> Any:
+        """Run a pure script-processing function inline, or in a worker process for long input.
+
+        ``batch_chars`` is the size of the whole request the script belongs to, so a
+        long novel split into many ordinary chapters still moves off the event loop.
+        """
+        if max(len(script), batch_chars) < SCRIPT_SPLIT_PARALLEL_THRESHOLD:
+            return func(script, *args)
+        return await asyncio.get_running_loop().run_in_executor(process_pool(), func, script, *args)
+
+    async def split_chapter_script(
+        chapter: Dict[str, Any], characters_by_name: Dict[str, Dict[str, Any]], batch_chars: int = 0
+    ):
+        """Segment a chapter, reusing cached segments for unchanged scripts.
+
+        The key is the script with blank lines and surrounding whitespace removed
+        (which ``split_script`` ignores anyway), plus the character names that
+        occur in it; other characters in the project cannot change the result.
+        """
+        script = chapter.get("script_content") or ""
+        normalized = "\n".join(line.strip() for line in script.splitlines() if line.strip())
+        speakers = sorted(name for name in characters_by_name if name and name in normalized)
+        split_hash = content_hash({"script": normalized, "speakers": speakers})
+        segments = split_cache.get(split_hash)
+        if segments is None:
+            segments = await run_script_job(split_script, normalized, tuple(speakers), batch_chars=batch_chars)
+            split_cache.put(split_hash, segments)
+        return chapter, split_hash, segments
+
+    def apply_chapter_split(
+        chapter: Dict[str, Any],
+        split_hash: str,
+        segments: List[Dict[str, Optional[str]]],
+        characters_by_name: Dict[str, Dict[str, Any]],
+    ) -> Iterator[tuple[Dict[str, Any], bool]]:
+        """Yield the chapter's storyboards for this split, creating them unless the same script was already split.
+
+        Storyboards from an earlier split of a different script are replaced;
+        storyboards created by hand are kept. ``character_id`` is resolved against
+        the current characters, so ones added since the last split get linked.
+        """
+        existing = store.list_storyboards(project_id=chapter["project_id"], chapter_id=chapter["id"])
+        previous = sorted(
+            (storyboard for storyboard in existing if storyboard.get("split_hash") == split_hash),
+            key=lambda item: item.get("order_index", 0),
+        )
+        if previous:
+            for storyboard in previous:
+                character = characters_by_name.get(storyboard.get("speaker") or "")
+                if character and storyboard.get("character_id") is None:
+                    storyboard["character_id"] = character["id"]
+                yield storyboard, True
+            return
+        superseded = [storyboard for storyboard in existing if storyboard.get("split_hash")]
+        for storyboard in superseded:
+            del store.storyboards[storyboard["id"]]
+        if superseded and not segments:
+            store._dump()
+        kept = [storyboard for storyboard in existing if not storyboard.get("split_hash")]
+        base_index = max([sb.get("order_index", 0) for sb in kept] + [-1]) + 1
+        for offset, segment in enumerate(segments):
+            character = characters_by_name.get(segment["speaker"] or "")
+            storyboard_id = store._next_id("storyboards")
+            storyboard = {
+                "id": storyboard_id,
+                "project_id": chapter["project_id"],
+                "chapter_id": chapter["id"],
+                "order_index": base_index + offset,
+                "speaker": segment["speaker"],
+                "character_id": character["id"] if character else None,
+                "dialogue": segment["dialogue"],
+                "scene_description": segment["scene_description"],
+                "image_url": None,
+                "split_hash": split_hash,
+                "created_at": utc_now_iso(),
+            }
+            store.storyboards[storyboard_id] = storyboard
+            yield storyboard, False
+
+    async def stream_chapter_splits(splits: Iterable[Awaitable[tuple]], characters_by_name) -> AsyncIterator[str]:
+        created = 0
+        try:
+            for pending in splits:
+                chapter, split_hash, segments = await pending
+                count = 0
+                cached = False
+                for storyboard, cached in apply_chapter_split(chapter, split_hash, segments, characters_by_name):
+                    count += 1
+                    yield format_sse({"event": "storyboard", "id": str(storyboard["id"]), "data": dict(storyboard)})
+                created += 0 if cached else count
+                yield format_sse(
+                    {"event": "chapter", "data": {"chapter_id": chapter["id"], "storyboards": count, "cached": cached}}
+                )
+            yield format_sse({"event": "done", "data": {"created": created}})
+        finally:
+            if created:
+                store._dump()
+
+    @app.post("/api/projects/{project_id}/chapters:split")
+    async def split_project_chapters_endpoint(
+        project_id: int,
+        request: Request,
+        current_user: Dict[str, Any] = Depends(get_current_user),
+    ):
+        ensure_project_access(project_id, current_user)
+        chapters = sorted(
+            (chapter for chapter in store.chapters.values() if chapter["project_id"] == project_id),
+            key=lambda item: item.get("order_index", 0),
+        )
+        characters_by_name = {
+            character["display_name"]: character for character in store.list_characters_for_project(project_id)
+        }
+        # Chapters are split concurrently, in separate processes once the project's
+        # scripts add up to the threshold, and written in completion order.
+        batch_chars = sum(len(chapter.get("script_content") or "") for chapter in chapters)
+        splits = asyncio.as_completed(
+            [split_chapter_script(chapter, characters_by_name, batch_chars) for chapter in chapters]
+        )
+        if "text/event-stream" in request.headers.get("accept", ""):
+            return StreamingResponse(
+                stream_chapter_splits(splits, characters_by_name),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+        results = []
+        created = 0
+        for pending in splits:
+            chapter, split_hash, segments = await pending
+            storyboards = list(apply_chapter_split(chapter, split_hash, segments, characters_by_name))
+            cached = bool(storyboards) and storyboards[0][1]
+            created += 0 if cached else len(storyboards)
+            results.append(
+                {
+                    "chapter_id": chapter["id"],
+                    "storyboards": [dict(storyboard) for storyboard, _ in storyboards],
+                    "cached": cached,
+                }
+            )
+        if created:
+            store._dump()
+        results.sort(key=lambda item: item["chapter_id"])
+        return {"chapters": results, "created": created}
+
     @app.post("/api/projects/{project_id}/chapters/{chapter_id}/split")
     async def split_chapter_endpoint(
         project_id: int,
         chapter_id: int,
+        request: Request,
         current_user: Dict[str, Any] = Depends(get_current_user),
     ):
         ensure_project_access(project_id, current_user)
         chapter = store.chapters.get(chapter_id)
         if not chapter or chapter["project_id"] != project_id:
             raise HTTPException(status_code=404, detail="Chapter not found")
-        # Generate three mock storyboards
-        generated: List[Dict[str, Any]] = []
-        templates = [
-            ("角色对话内容1", "场景描述1"),
-            ("角色对话内容2", "场景描述2"),
-            ("角色对话内容3", "场景描述3"),
-        ]
-        base_index = max(
-            [sb.get("order_index", 0) for sb in store.list_storyboards(project_id=project_id, chapter_id=chapter_id)]
-            + [-1]
-        ) + 1
-        for offset, (dialogue, scene_description) in enumerate(templates):
-            storyboard_id = store._next_id("storyboards")
-            storyboard = {
-                "id": storyboard_id,
-                "project_id": project_id,
-                "chapter_id": chapter_id,
-                "order_index": base_index + offset,
-                "dialogue": dialogue,
-                "scene_description": scene_description,
-                "image_url": None,
-                "created_at": utc_now_iso(),
-            }
-            store.storyboards[storyboard_id] = storyboard
-            generated.append(storyboard)
-        store._dump()
-        return [dict(storyboard) for storyboard in generated]
+        characters_by_name = {
+            character["display_name"]: character for character in store.list_characters_for_project(project_id)
+        }
+        split = split_chapter_script(chapter, characters_by_name)
+        if "text/event-stream" in request.headers.get("accept", ""):
+            return StreamingResponse(
+                stream_chapter_splits([split], characters_by_name),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+        chapter, split_hash, segments = await split
+        storyboards = list(apply_chapter_split(chapter, split_hash, segments, characters_by_name))
+        if storyboards and not storyboards[0][1]:
+            store._dump()
+        return [dict(storyboard) for storyboard, _ in storyboards]
 
     # Storyboard management ----------------------------------------------------------
 
@@ -928,33 +3485,45 @@ def create_app() -> FastAPI:
         store._dump()
         return dict(storyboard)
 
-    def create_project_task(project_id: int, current_user: Dict[str, Any], task_type: str) -> Dict[str, Any]:
+    def create_project_task(
+        project_id: int,
+        request: Request,
+        response: Response,
+        current_user: Dict[str, Any],
+        task_type: str,
+    ) -> Dict[str, Any]:
         ensure_project_access(project_id, current_user)
         payload = {"project_id": project_id}
-        return store.create_task(current_user["organization_id"], task_type, payload)
+        return create_task_once(request, response, current_user, task_type, payload)
 
     @app.post("/api/projects/{project_id}/storyboards:generate-images")
     async def generate_storyboard_images(
         project_id: int,
+        request: Request,
+        response: Response,
         current_user: Dict[str, Any] = Depends(get_current_user),
     ):
-        task = create_project_task(project_id, current_user, "generate_storyboard_images")
+        task = create_project_task(project_id, request, response, current_user, "generate_storyboard_images")
         return serialize_task(task)
 
     @app.post("/api/projects/{project_id}/storyboards:generate-keyframes")
     async def generate_storyboard_keyframes(
         project_id: int,
+        request: Request,
+        response: Response,
         current_user: Dict[str, Any] = Depends(get_current_user),
     ):
-        task = create_project_task(project_id, current_user, "generate_storyboard_keyframes")
+        task = create_project_task(project_id, request, response, current_user, "generate_storyboard_keyframes")
         return serialize_task(task)
 
     @app.post("/api/projects/{project_id}/storyboards:generate-videos")
     async def generate_storyboard_videos(
         project_id: int,
+        request: Request,
+        response: Response,
         current_user: Dict[str, Any] = Depends(get_current_user),
     ):
-        task = create_project_task(project_id, current_user, "generate_storyboard_videos")
+        task = create_project_task(project_id, request, response, current_user, "generate_storyboard_videos")
         return serialize_task(task)
 
     # Character management -----------------------------------------------------------
@@ -1106,6 +3675,8 @@ def create_app() -> FastAPI:
         payload: AssetCreateRequest,
         current_user: Dict[str, Any] = Depends(get_current_user),
     ):
+        if payload.object_key and not store.organization_owns_object(current_user["organization_id"], payload.object_key):
+            raise HTTPException(status_code=404, detail="Object not found")
         asset = store.create_asset(
             {
                 "organization_id": current_user["organization_id"],
@@ -1120,6 +3691,9 @@ def create_app() -> FastAPI:
                 "uploaded_by_id": current_user["id"],
             }
         )
+        record = store.storage_objects.get(payload.object_key)
+        if record and record["organization_id"] == current_user["organization_id"]:
+            schedule_derivatives(record)
         return serialize_asset(asset)
 
     @app.patch("/api/assets/{asset_id}")
@@ -1144,8 +3718,9 @@ def create_app() -> FastAPI:
         asset = store.assets.get(asset_id)
         if not asset or asset["organization_id"] != current_user["organization_id"]:
             raise HTTPException(status_code=404, detail="Asset not found")
-        del store.assets[asset_id]
-        store._dump()
+        orphaned_hash = store.delete_asset(asset_id)
+        if orphaned_hash:
+            object_store.delete_blob(orphaned_hash)
         return Response(status_code=204)
 
     # Task management ----------------------------------------------------------------
@@ -1163,6 +3738,76 @@ def create_app() -> FastAPI:
         limited = tasks_sorted[:limit]
         return [serialize_task(task) for task in limited]
 
+    @app.get("/api/tasks/stats")
+    async def task_stats_endpoint(
+        current_user: Dict[str, Any] = Depends(get_current_user),
+    ):
+        return store.task_stats.snapshot(current_user["organization_id"])
+
+    @app.get("/api/tasks/archive")
+    async def list_archived_tasks_endpoint(
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        status: Optional[str] = None,
+        limit: int = Query(50, ge=1, le=200),
+        current_user: Dict[str, Any] = Depends(get_current_user),
+    ):
+        organization_id = current_user["organization_id"]
+        archived = store.archive.query(
+            "tasks",
+            start=start,
+            end=end,
+            predicate=lambda task: task["organization_id"] == organization_id
+            and (not status or task.get("status") == status),
+        )
+        limited = await asyncio.to_thread(list, islice(archived, limit))
+        return [serialize_task(task) for task in limited]
+
+    @app.get("/api/tasks/dead-letters")
+    async def list_dead_letters_endpoint(
+        task_type: Optional[str] = None,
+        current_user: Dict[str, Any] = Depends(get_current_user),
+    ):
+        ensure_admin(current_user)
+        entries = [
+            entry
+            for entry in store.dead_letters.values()
+            if entry["organization_id"] == current_user["organization_id"]
+            and (not task_type or entry["task_type"] == task_type)
+        ]
+        return sorted(entries, key=lambda item: item["dead_lettered_at"], reverse=True)
+
+    @app.post("/api/tasks/dead-letters:redrive")
+    async def redrive_dead_letters_endpoint(
+        payload: DeadLetterRedriveRequest,
+        current_user: Dict[str, Any] = Depends(get_current_user),
+    ):
+        ensure_admin(current_user)
+        organization_id = current_user["organization_id"]
+        task_ids = payload.task_ids
+        if task_ids is None:
+            task_ids = [
+                entry["task_id"]
+                for entry in store.dead_letters.values()
+                if entry["organization_id"] == organization_id
+            ]
+        redriven = []
+        for task_id in task_ids:
+            entry = store.dead_letters.get(task_id)
+            task = store.tasks.get(task_id)
+            if not entry or not task or entry["organization_id"] != organization_id:
+                continue
+            redriven.append(serialize_task(store.requeue_task(task)))
+        store._dump()
+        return redriven
+
+    @app.get("/api/tasks/generation-cache")
+    async def generation_cache_stats(
+        current_user: Dict[str, Any] = Depends(get_current_user),
+    ):
+        ensure_admin(current_user)
+        return store.generation_cache.stats()
+
     def ensure_task_access(task_id: int, current_user: Dict[str, Any]) -> Dict[str, Any]:
         task = store.tasks.get(task_id)
         if not task or task["organization_id"] != current_user["organization_id"]:
@@ -1173,16 +3818,40 @@ def create_app() -> FastAPI:
     async def get_task_endpoint(
         task_id: int,
         current_user: Dict[str, Any] = Depends(get_current_user),
+    ):
+        if task_id not in store.tasks:
+            archived = await asyncio.to_thread(store.archive.find, "tasks", task_id)
+            if archived and archived["organization_id"] == current_user["organization_id"]:
+                return serialize_task(archived)
+        task = ensure_task_access(task_id, current_user)
+        return serialize_task(task)
+
+    @app.patch("/api/tasks/{task_id}")
+    async def update_task_endpoint(
+        task_id: int,
+        payload: TaskUpdateRequest,
+        current_user: Dict[str, Any] = Depends(get_current_user),
     ):
         task = ensure_task_access(task_id, current_user)
+        update_fields = payload.model_dump(exclude_none=True)
+        if not update_fields:
+            raise HTTPException(status_code=400, detail="At least one field must be provided")
+        if payload.status is not None and payload.status not in CLIENT_SETTABLE_TASK_STATUSES:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Invalid task status; expected one of {', '.join(sorted(CLIENT_SETTABLE_TASK_STATUSES))}",
+            )
+        store.update_task(task, update_fields)
         return serialize_task(task)
 
     @app.post("/api/tasks", status_code=201)
     async def create_task_endpoint(
         payload: TaskCreateRequest,
+        request: Request,
+        response: Response,
         current_user: Dict[str, Any] = Depends(get_current_user),
     ):
-        task = store.create_task(current_user["organization_id"], payload.task_type, payload.payload)
+        task = create_task_once(request, response, current_user, payload.task_type, payload.payload)
         return serialize_task(task)
 
     @app.post("/api/tasks/{task_id}/retry")
@@ -1191,43 +3860,55 @@ def create_app() -> FastAPI:
         current_user: Dict[str, Any] = Depends(get_current_user),
     ):
         task = ensure_task_access(task_id, current_user)
-        task["status"] = "queued"
-        task["progress"] = 0
-        task["error_message"] = None
-        task["retry_token"] = generate_token("retry")
-        task["created_at"] = utc_now_iso()
+        store.requeue_task(task)
         store._dump()
         return serialize_task(task)
 
     @app.post("/api/tasks/text-to-image", status_code=201)
     async def create_text_to_image_task(
         payload: TextToImageRequest,
+        request: Request,
+        response: Response,
         current_user: Dict[str, Any] = Depends(get_current_user),
     ):
-        task = store.create_task(current_user["organization_id"], "text_to_image", payload.model_dump())
+        task = create_task_once(request, response, current_user, "text_to_image", payload.model_dump())
         return serialize_task(task)
 
     @app.post("/api/tasks/generate-character-images", status_code=201)
     async def generate_character_images_task(
         payload: CharacterImageTaskRequest,
+        request: Request,
+        response: Response,
         current_user: Dict[str, Any] = Depends(get_current_user),
     ):
         character = store.characters.get(payload.character_id)
         if not character:
             raise HTTPException(status_code=404, detail="Character not found")
-        task = store.create_task(
-            current_user["organization_id"],
+        task = create_task_once(
+            request,
+            response,
+            current_user,
             "generate_character_images",
             payload.model_dump(),
         )
-        # Simulate portrait updates
-        generated_portraits = [
-            {
-                "src": f"https://cdn.example.com/characters/{payload.character_id}_{angle}.jpg",
-                "alt": angle,
-            }
-            for angle in ["front", "side", "three-quarter"]
-        ]
+        if response.headers.get("Idempotent-Replayed"):
+            return serialize_task(task)
+        if task["result"] and task["result"].get("cache_hit"):
+            generated_portraits = task["result"]["portraits"]
+        else:
+            # Simulate portrait updates
+            generated_portraits = [
+                {
+                    "src": f"https://cdn.example.com/characters/{payload.character_id}_{angle}.jpg",
+                    "alt": angle,
+                }
+                for angle in ["front", "side", "three-quarter"]
+            ]
+            store.update_task(
+                task,
+                {"status": "completed", "progress": 100, "result": {"portraits": generated_portraits}},
+                cache_result=True,
+            )
         character["portraits"] = generated_portraits
         character["updated_at"] = utc_now_iso()
         store._dump()
@@ -1235,91 +3916,401 @@ def create_app() -> FastAPI:
 
     # Storage management -------------------------------------------------------------
 
-    @app.post("/api/storage/upload")
-    async def upload_file(
-        file: UploadFile,
-        current_user: Dict[str, Any] = Depends(get_current_user),
+    derivative_jobs: Dict[str, asyncio.Task] = {}
+
+    async def build_derivatives(sha256: str, media_kind: str) -> None:
+        try:
+            produced = await asyncio.get_running_loop().run_in_executor(
+                process_pool(),
+                render_derivatives,
+                str(object_store.blob_path(sha256)),
+                str(object_store.derivative_dir(sha256)),
+                media_kind,
+            )
+        except Exception as exc:
+            LOG.warning("rendering derivatives for %s failed", sha256, exc_info=True)
+            for object_key in store.storage_objects_by_hash.get(sha256, ()):
+                store.storage_objects[object_key]["derivatives_error"] = f"{type(exc).__name__}: {exc}"
+            store._dump()
+            return
+        finally:
+            derivative_jobs.pop(sha256, None)
+        if not produced:
+            return
+        for object_key in store.storage_objects_by_hash.get(sha256, ()):
+            store.storage_objects[object_key]["derivatives"] = produced
+            store.storage_objects[object_key].pop("derivatives_error", None)
+        store._dump()
+
+    def signed_derivative_url(sha256: str, filename: str) -> str:
+        # Expiry is aligned to the hour so the URL, and the browser's cached copy, stays
+        # stable across responses; it is valid for one to two hours after issue.
+        expires = (int(time.time()) // PRESIGN_DEFAULT_EXPIRES_SECONDS + 2) * PRESIGN_DEFAULT_EXPIRES_SECONDS
+        signature = sign_object_url(presign_secret, f".derivatives/{sha256}/{filename}", expires)
+        return f"/api/storage/derivatives/{sha256}/{filename}?expires={expires}&signature={signature}"
+
+    def schedule_derivatives(record: Dict[str, Any]) -> None:
+        """Render thumbnails for an image or video object in the background, once per content hash."""
+        media_kind = (record.get("content_type") or "").split("/", 1)[0]
+        sha256 = record.get("sha256")
+        if media_kind not in {"image", "video"} or record.get("derivatives") or not sha256:
+            return
+        if sha256 in derivative_jobs or not object_store.has_blob(sha256):
+            return
+        derivative_jobs[sha256] = asyncio.create_task(build_derivatives(sha256, media_kind))
+
+    @app.get("/api/storage/derivatives/{sha256}/{filename}")
+    async def download_derivative(
+        sha256: str,
+        filename: str,
+        expires: int = Query(...),
+        signature: str = Query(...),
     ):
-        object_key = f"{current_user['organization_id']}/{generate_token('upload', 8)}-{file.filename}"
+        if not verify_object_signature(presign_secret, f".derivatives/{sha256}/{filename}", expires, signature):
+            raise HTTPException(status_code=403, detail="Invalid or expired signature")
+        if not re.fullmatch(r"[0-9a-f]{64}", sha256) or not re.fullmatch(r"[a-z_]+\.jpg", filename):
+            raise HTTPException(status_code=404, detail="Derivative not found")
+        path = object_store.derivative_dir(sha256) / filename
+        if not path.exists():
+            raise HTTPException(status_code=404, detail="Derivative not found")
+        # Thumbnails of private assets: cache in the browser only, and no longer than the signature lasts.
+        max_age = max(0, expires - int(time.time()))
+        return FileResponse(
+            path,
+            media_type="image/jpeg",
+            headers={"Cache-Control": f"private, max-age={max_age}", "ETag": f'"{sha256}-{filename}"'},
+        )
+
+    def new_object_key(current_user: Dict[str, Any], filename: Optional[str]) -> str:
+        safe_name = Path(filename or "file").name or "file"
+        return f"{current_user['organization_id']}/{generate_token('upload', 8)}-{safe_name}"
+
+    def record_storage_object(
+        object_key: str,
+        current_user: Dict[str, Any],
+        filename: Optional[str],
+        content_type: Optional[str],
+        written: Dict[str, Any],
+    ) -> Dict[str, Any]:
         record = {
             "object_key": object_key,
             "url": f"https://your-oss-domain.com/{object_key}",
             "organization_id": current_user["organization_id"],
+            "filename": filename,
+            "content_type": content_type or "application/octet-stream",
+            "size": written["size"],
+            "sha256": written["sha256"],
+            "uploaded_by": current_user["id"],
+            "created_at": utc_now_iso(),
         }
+        previous = store.find_storage_object_by_hash(written["sha256"], current_user["organization_id"])
+        if previous and previous.get("derivatives"):
+            record["derivatives"] = previous["derivatives"]
         store.upsert_storage_object(record)
-        response = {
-            "file_id": object_key,
-            "object_key": object_key,
+        schedule_derivatives(record)
+        return record
+
+    def serialize_upload(record: Dict[str, Any], deduplicated: bool = False) -> Dict[str, Any]:
+        return {
+            "file_id": record["object_key"],
+            "object_key": record["object_key"],
             "file_url": record["url"],
-            "filename": file.filename,
-            "size": 1024000,
-            "content_type": file.content_type or "application/octet-stream",
-            "uploaded_by": current_user["id"],
+            "filename": record["filename"],
+            "size": record["size"],
+            "sha256": record["sha256"],
+            "content_type": record["content_type"],
+            "uploaded_by": record["uploaded_by"],
+            "deduplicated": deduplicated,
         }
-        return response
+
+    @app.post("/api/storage/upload")
+    async def upload_file(
+        file: UploadFile,
+        current_user: Dict[str, Any] = Depends(get_current_user),
+    ):
+        object_key = new_object_key(current_user, file.filename)
+        written = await object_store.put_stream(iter_upload_file(file, UPLOAD_CHUNK_SIZE))
+        record = record_storage_object(object_key, current_user, file.filename, file.content_type, written)
+        return serialize_upload(record, written["deduplicated"])
+
+    @app.post("/api/storage/instant-upload")
+    async def instant_upload(
+        payload: InstantUploadRequest,
+        current_user: Dict[str, Any] = Depends(get_current_user),
+    ):
+        sha256 = payload.sha256.lower()
+        existing = store.find_storage_object_by_hash(sha256, current_user["organization_id"])
+        if not existing or not object_store.has_blob(sha256):
+            raise HTTPException(status_code=404, detail="Content not found, upload the file instead")
+        object_key = new_object_key(current_user, payload.filename)
+        written = {"size": existing["size"], "sha256": sha256}
+        record = record_storage_object(object_key, current_user, payload.filename, payload.content_type, written)
+        return serialize_upload(record, deduplicated=True)
+
+    def ensure_multipart_access(upload_id: str, current_user: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            session = object_store.get_multipart(upload_id)
+        except ValueError:
+            session = None
+        if not session or session["organization_id"] != current_user["organization_id"]:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        return session
+
+    @app.post("/api/storage/multipart", status_code=201)
+    async def create_multipart_upload(
+        payload: MultipartUploadCreateRequest,
+        current_user: Dict[str, Any] = Depends(get_current_user),
+    ):
+        object_key = new_object_key(current_user, payload.filename)
+        session = object_store.create_multipart(
+            object_key,
+            {
+                "organization_id": current_user["organization_id"],
+                "filename": payload.filename,
+                "content_type": payload.content_type,
+            },
+        )
+        return {**session, "chunk_size": UPLOAD_CHUNK_SIZE, "parts": []}
+
+    @app.get("/api/storage/multipart/{upload_id}")
+    async def get_multipart_upload(
+        upload_id: str,
+        current_user: Dict[str, Any] = Depends(get_current_user),
+    ):
+        return ensure_multipart_access(upload_id, current_user)
+
+    @app.put("/api/storage/multipart/{upload_id}/parts/{part_number}")
+    async def upload_multipart_part(
+        upload_id: str,
+        part_number: int,
+        request: Request,
+        current_user: Dict[str, Any] = Depends(get_current_user),
+    ):
+        ensure_multipart_access(upload_id, current_user)
+        if not 1 <= part_number <= MULTIPART_MAX_PARTS:
+            raise HTTPException(status_code=400, detail=f"Part number must be between 1 and {MULTIPART_MAX_PARTS}")
+        return await object_store.put_part(upload_id, part_number, request.stream())
+
+    @app.post("/api/storage/multipart/{upload_id}/complete")
+    async def complete_multipart_upload(
+        upload_id: str,
+        current_user: Dict[str, Any] = Depends(get_current_user),
+    ):
+        session = ensure_multipart_access(upload_id, current_user)
+        if not session["parts"]:
+            raise HTTPException(status_code=400, detail="No parts uploaded")
+        written = await object_store.complete_multipart(session)
+        record = record_storage_object(
+            session["object_key"], current_user, session["filename"], session["content_type"], written
+        )
+        return {**serialize_upload(record, written["deduplicated"]), "parts": written["parts"]}
+
+    @app.delete("/api/storage/multipart/{upload_id}", status_code=204, response_class=Response)
+    async def abort_multipart_upload(
+        upload_id: str,
+        current_user: Dict[str, Any] = Depends(get_current_user),
+    ):
+        ensure_multipart_access(upload_id, current_user)
+        object_store.abort_multipart(upload_id)
+        return Response(status_code=204)
 
     @app.get("/api/storage/presign")
     async def presign_url(
+        request: Request,
         object_key: str = Query(...),
+        expires_in: int = Query(PRESIGN_DEFAULT_EXPIRES_SECONDS, ge=1, le=PRESIGN_MAX_EXPIRES_SECONDS),
         current_user: Dict[str, Any] = Depends(get_current_user),
     ):
-        organization_id = current_user["organization_id"]
-        valid = False
-        if object_key.startswith(f"{organization_id}/") or f"/{organization_id}/" in object_key:
-            valid = True
-        else:
-            for asset in store.list_assets_for_org(organization_id):
-                if asset.get("object_key") == object_key:
-                    valid = True
-                    break
-        if not valid:
+        if not store.organization_owns_object(current_user["organization_id"], object_key):
+            raise HTTPException(status_code=404, detail="Object not found")
+        expires = int(time.time()) + expires_in
+        signature = sign_object_url(presign_secret, object_key, expires)
+        base_url = str(request.base_url).rstrip("/")
+        url = f"{base_url}/api/storage/objects/{quote(object_key)}?expires={expires}&signature={signature}"
+        return {
+            "url": url,
+            "method": "GET",
+            "expires_at": utc_iso_from_timestamp(expires),
+            "signed_headers": {},
+        }
+
+    @app.api_route("/api/storage/objects/{object_key:path}", methods=["GET", "HEAD"])
+    async def download_object(
+        object_key: str,
+        request: Request,
+        expires: int = Query(...),
+        signature: str = Query(...),
+    ):
+        if not verify_object_signature(presign_secret, object_key, expires, signature):
+            raise HTTPException(status_code=403, detail="Invalid or expired signature")
+        record = store.storage_objects.get(object_key)
+        if not record:
             raise HTTPException(status_code=404, detail="Object not found")
-        url = f"https://your-oss-domain.com/{object_key}"
-        return {"url": url, "method": "GET", "expires_at": None, "signed_headers": {}}
+        if not record.get("sha256") or not object_store.has_blob(record["sha256"]):
+            if record.get("url"):
+                return RedirectResponse(record["url"])
+            raise HTTPException(status_code=404, detail="Object not found")
+        path = object_store.blob_path(record["sha256"])
+        size = record["size"]
+        media_type = record.get("content_type") or "application/octet-stream"
+        headers = {
+            "Accept-Ranges": "bytes",
+            "ETag": f'"{record["sha256"]}"',
+            "Cache-Control": "private, max-age=3600",
+        }
+        range_header = request.headers.get("range")
+        byte_range = parse_byte_range(range_header, size) if range_header else None
+        if byte_range is None:
+            # FileResponse hands the path to the server via http.response.pathsend when supported.
+            return FileResponse(path, media_type=media_type, headers=headers)
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        if request.method == "HEAD":
+            return Response(status_code=206, media_type=media_type, headers=headers)
+        return StreamingResponse(
+            iter_file_range(path, start, end, UPLOAD_CHUNK_SIZE),
+            status_code=206,
+            media_type=media_type,
+            headers=headers,
+        )
 
     # Agent module ------------------------------------------------------------------
 
+    async def stream_workflow(
+        request: Request, workflow_id: str, payload: WorkflowRunRequest
+    ) -> AsyncIterator[str]:
+        # The bounded queue makes the producer wait whenever the client reads slowly.
+        queue: asyncio.Queue = asyncio.Queue(maxsize=WORKFLOW_STREAM_BUFFER)
+
+        async def produce() -> None:
+            try:
+                async for event in run_workflow_events(payload):
+                    await queue.put(event)
+            except Exception as exc:
+                await queue.put({"event": "error", "data": str(exc)})
+            await queue.put(None)
+
+        started = time.perf_counter()
+        producer = asyncio.create_task(produce())
+        workflow_metrics["streams_started"] += 1
+        first_event = True
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    break
+                if first_event:
+                    workflow_metrics["time_to_first_event"].observe(time.perf_counter() - started)
+                    first_event = False
+                yield format_sse(event)
+            yield format_sse({"event": "done", "data": {"workflow_id": workflow_id}})
+            workflow_metrics["streams_completed"] += 1
+        finally:
+            if not producer.done():
+                producer.cancel()
+                workflow_metrics["streams_cancelled"] += 1
+
     @app.post("/api/agents/workflow/run")
     async def run_workflow(
         payload: WorkflowRunRequest,
+        request: Request,
         current_user: Dict[str, Any] = Depends(get_current_user),
     ):
         workflow_id = payload.workflow_id or "default_workflow"
-        events = [
-            {"event": "message", "data": "生成的内容...", "id": "event_1"},
-            {"event": "message", "data": "更多创意灵感。", "id": "event_2"},
-        ]
+        if "text/event-stream" in request.headers.get("accept", ""):
+            return StreamingResponse(
+                stream_workflow(request, workflow_id, payload),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+        events = [event async for event in run_workflow_events(payload)]
         return {"workflow_id": workflow_id, "events": events}
 
+    @app.get("/api/agents/workflow/metrics")
+    async def workflow_metrics_endpoint(
+        current_user: Dict[str, Any] = Depends(get_current_user),
+    ):
+        ensure_admin(current_user)
+        return {
+            "streams_started": workflow_metrics["streams_started"],
+            "streams_completed": workflow_metrics["streams_completed"],
+            "streams_cancelled": workflow_metrics["streams_cancelled"],
+            "time_to_first_event_seconds": workflow_metrics["time_to_first_event"].summary(),
+        }
+
+    character_extraction_cache = LRUCache(CHARACTER_EXTRACTION_CACHE_MAX_ENTRIES, SCRIPT_SPLIT_CACHE_MAX_BYTES)
+
+    async def extract_cached(script: str, batch_chars: int = 0) -> tuple[List[Dict[str, Any]], bool]:
+        key = content_hash({"script": script})
+        found = character_extraction_cache.get(key)
+        if found is not None:
+            return found, True
+        found = await run_script_job(extract_script_characters, script, batch_chars=batch_chars)
+        character_extraction_cache.put(key, found)
+        return found, False
+
     @app.post("/api/agents/generate-characters")
     async def generate_characters(
         payload: GenerateCharactersRequest,
         current_user: Dict[str, Any] = Depends(get_current_user),
     ):
         ensure_project_access(payload.project_id, current_user)
-        characters = [
-            {
-                "name": "皇帝",
-                "displayName": "皇帝",
-                "description": "威严的皇帝,统治天下",
-                "roleType": "主角",
-                "voicePreset": "",
-                "voiceSpeed": 1.0,
-                "voiceScript": "朕即天下",
-                "portraits": [],
-            },
-            {
-                "name": "皇后",
-                "displayName": "皇后",
-                "description": "温柔贤惠的皇后",
-                "roleType": "主角",
-                "voicePreset": "",
-                "voiceSpeed": 1.1,
-                "voiceScript": "本宫相信你。",
-                "portraits": [],
-            },
-        ]
-        return {"success": True, "characters": characters, "project_id": payload.project_id, "events_count": 3}
+        chapters = sorted(
+            (chapter for chapter in store.chapters.values() if chapter["project_id"] == payload.project_id),
+            key=lambda item: (item.get("order_index", 0), item["id"]),
+        )
+        sources = [(chapter["id"], chapter.get("script_content") or "") for chapter in chapters]
+        sources.append((None, payload.role_info))
+        batch_chars = sum(len(script) for _, script in sources)
+        extracted = await asyncio.gather(*(extract_cached(script, batch_chars) for _, script in sources))
+
+        merged: Dict[str, Dict[str, Any]] = {}
+        for (chapter_id, _), (found, _) in zip(sources, extracted):
+            for entry in found:
+                character = merged.setdefault(
+                    entry["name"], {"name": entry["name"], "lines": 0, "sample_line": entry["sample_line"], "chapters": []}
+                )
+                character["lines"] += entry["lines"]
+                if chapter_id is not None:
+                    character["chapters"].append(chapter_id)
+
+        existing = {
+            character["display_name"]: character for character in store.list_characters_for_project(payload.project_id)
+        }
+        ranked = sorted(merged.values(), key=lambda item: item["lines"], reverse=True)
+        characters = []
+        for rank, entry in enumerate(ranked):
+            if entry["name"] in existing:
+                continue
+            characters.append(
+                {
+                    "name": entry["name"],
+                    "displayName": entry["name"],
+                    "description": f"出现于{len(entry['chapters'])}个章节,共{entry['lines']}句台词",
+                    "roleType": "主角" if rank < 2 else "配角",
+                    "voicePreset": "",
+                    "voiceSpeed": 1.0,
+                    "voiceScript": entry["sample_line"],
+                    "portraits": [],
+                    "chapterIds": entry["chapters"],
+                }
+            )
+        return {
+            "success": True,
+            "characters": characters,
+            "existing_character_ids": [existing[name]["id"] for name in merged if name in existing],
+            "project_id": payload.project_id,
+            "chapters_processed": len(chapters),
+            "chapters_cached": sum(cached for (chapter_id, _), (_, cached) in zip(sources, extracted) if chapter_id),
+            "events_count": len(sources),
+        }
 
     # Notifications -----------------------------------------------------------------
 
@@ -1333,6 +4324,23 @@ def create_app() -> FastAPI:
         )
         return [serialize_notification(notification) for notification in notifications_sorted]
 
+    @app.get("/api/notifications/archive")
+    async def list_archived_notifications_endpoint(
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: int = Query(50, ge=1, le=200),
+        current_user: Dict[str, Any] = Depends(get_current_user),
+    ):
+        organization_id = current_user["organization_id"]
+        archived = store.archive.query(
+            "notifications",
+            start=start,
+            end=end,
+            predicate=lambda notification: notification["organization_id"] == organization_id,
+        )
+        limited = await asyncio.to_thread(list, islice(archived, limit))
+        return [serialize_notification(notification) for notification in limited]
+
     @app.patch("/api/notifications/{notification_id}:read")
     async def mark_notification_read(
         notification_id: int,
@@ -1358,12 +4366,21 @@ def create_app() -> FastAPI:
             raise HTTPException(status_code=404, detail="Plan not found")
         return plan
 
+    def ensure_valid_rate_limits(rate_limits: Optional[Dict[str, Dict[str, float]]]) -> None:
+        if rate_limits is None:
+            return
+        try:
+            validate_rate_limits(rate_limits, complete=False)
+        except ValueError as exc:
+            raise HTTPException(status_code=422, detail=str(exc))
+
     @app.post("/api/plans", status_code=201)
     async def create_plan(
         payload: PlanCreateRequest,
         current_user: Dict[str, Any] = Depends(get_current_user),
     ):
         ensure_admin(current_user)
+        ensure_valid_rate_limits(payload.rate_limits)
         plan_id = store._next_id("plans")
         plan = {
             "id": plan_id,
@@ -1387,8 +4404,11 @@ def create_app() -> FastAPI:
     ):
         ensure_admin(current_user)
         plan = ensure_plan(plan_id)
+        ensure_valid_rate_limits(payload.rate_limits)
         for field, value in payload.model_dump(exclude_none=True).items():
             plan[field] = value
+        # Any number of organizations may be on this plan, so drop every cached plan lookup.
+        org_plans.clear()
         store._dump()
         return dict(plan)
 
@@ -1400,6 +4420,7 @@ def create_app() -> FastAPI:
         ensure_admin(current_user)
         ensure_plan(plan_id)
         del store.plans[plan_id]
+        org_plans.clear()
         store._dump()
         return Response(status_code=204)
 
@@ -1418,6 +4439,7 @@ def create_app() -> FastAPI:
             "created_at": utc_now_iso(),
         }
         store.subscriptions[subscription_id] = subscription
+        org_plans.pop(current_user["organization_id"])
         store._dump()
         return dict(subscription)
 
@@ -1555,23 +4577,80 @@ def create_app() -> FastAPI:
 
     @app.get("/api/tts/voices")
     async def list_voices(
+        request: Request,
         scene_category: Optional[str] = None,
         gender: Optional[str] = None,
         support_language: Optional[str] = None,
         is_support_mix: Optional[int] = None,
         current_user: Dict[str, Any] = Depends(get_current_user),
     ):
-        voices = store.voices
+        criteria: Dict[str, Any] = {}
         if scene_category:
-            voices = [voice for voice in voices if voice.get("scene_category") == scene_category]
+            criteria["scene_category"] = scene_category
         if gender:
-            voices = [voice for voice in voices if voice.get("gender") == gender]
+            criteria["gender"] = gender
         if support_language:
-            voices = [voice for voice in voices if voice.get("support_language") == support_language]
+            criteria["support_language"] = support_language
         if is_support_mix is not None:
-            bool_value = bool(is_support_mix)
-            voices = [voice for voice in voices if bool(voice.get("is_support_mix")) == bool_value]
-        return voices
+            criteria["is_support_mix"] = bool(is_support_mix)
+        body, etag = store.voice_catalog.response(criteria)
+        headers = {"ETag": etag, "Cache-Control": f"private, max-age={VOICE_CATALOG_MAX_AGE_SECONDS}"}
+        if etag_matches(request.headers.get("if-none-match", ""), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    async def synthesize_cached(params: Dict[str, Any]) -> tuple[Dict[str, Any], bool]:
+        cache_key = tts_cache_key(params)
+        cached = store.tts_cache.get(cache_key)
+        if cached:
+            return cached, True
+        audio = await synthesize_tts_audio(params)
+        store.tts_cache.put(cache_key, audio)
+        return audio, False
+
+    def tts_params(payload: TtsSynthesizeRequest) -> Dict[str, Any]:
+        if len(payload.text) > TTS_MAX_TEXT_CHARS:
+            raise HTTPException(status_code=422, detail=f"Text must be at most {TTS_MAX_TEXT_CHARS} characters")
+        return payload.model_dump(
+            include={"text", "voice_type", "emotion", "speed", "volume", "sample_rate", "audio_format"}
+        )
+
+    async def run_tts_job(job: TtsJob) -> None:
+        try:
+            async for chunk in stream_tts_audio(job.params):
+                await job.append(chunk)
+            # The streamed audio is the synthesis result; cache it rather than synthesizing again.
+            audio = {"audio_url": tts_audio_url(job.params)}
+            store.tts_cache.put(tts_cache_key(job.params), audio)
+            store._dump()
+            await job.finish("succeeded", audio_url=audio["audio_url"])
+        except Exception as exc:
+            await job.finish("failed", error_message=str(exc))
+        finally:
+            running_tts_jobs.pop(job.task_id, None)
+            tts_jobs.set(job.task_id, job)
+
+    def reserve_tts_job_bytes(job: TtsJob) -> None:
+        """Make room for ``job``'s audio under TTS_JOB_MAX_BYTES, dropping the oldest finished jobs first."""
+        if job.audio_bytes > TTS_JOB_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="Requested audio is too large for an asynchronous TTS task")
+        finished = tts_jobs.values()
+        buffered = sum(existing.audio_bytes for existing in [*running_tts_jobs.values(), *finished])
+        for existing in finished:
+            if buffered + job.audio_bytes <= TTS_JOB_MAX_BYTES:
+                break
+            tts_jobs.pop(existing.task_id)
+            buffered -= existing.audio_bytes
+        if buffered + job.audio_bytes > TTS_JOB_MAX_BYTES:
+            raise HTTPException(
+                status_code=503, detail="Too many TTS tasks in progress, retry shortly", headers={"Retry-After": "1"}
+            )
+
+    def ensure_tts_job_access(task_id: str, current_user: Dict[str, Any]) -> TtsJob:
+        job = running_tts_jobs.get(task_id) or tts_jobs.get(task_id)
+        if not job or job.organization_id != current_user["organization_id"]:
+            raise HTTPException(status_code=404, detail="TTS task not found")
+        return job
 
     @app.post("/api/tts/synthesize")
     async def synthesize_speech(
@@ -1579,14 +4658,142 @@ def create_app() -> FastAPI:
         current_user: Dict[str, Any] = Depends(get_current_user),
     ):
         task_id = f"tts-{utc_now_iso().replace(':', '').replace('-', '')}-{generate_token('id', 6)}"
+        params = tts_params(payload)
+        if payload.wait_for_result is False:
+            job = TtsJob(task_id, current_user["organization_id"], params)
+            reserve_tts_job_bytes(job)
+            running_tts_jobs[task_id] = job
+            runner = asyncio.create_task(run_tts_job(job))
+            tts_job_runners.add(runner)
+            runner.add_done_callback(tts_job_runners.discard)
+            return {
+                **job.to_dict(),
+                "poll_url": f"/api/tts/tasks/{task_id}",
+                "stream_url": f"/api/tts/tasks/{task_id}/stream",
+            }
+        try:
+            audio, cached = await asyncio.wait_for(synthesize_cached(params), timeout=payload.timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="TTS synthesis timed out")
+        if not cached:
+            store._dump()
         response = {
             "task_id": task_id,
             "status": "succeeded",
-            "audio_url": f"https://oss.example.com/{current_user['organization_id']}/tts/{task_id}.mp3",
-            "audio_content_base64": "UklGRjIAAABXQVZFZm10IBAAAAABAAEA...",
+            "audio_url": audio["audio_url"],
+            "audio_content_base64": TTS_PLACEHOLDER_AUDIO_BASE64,
+            "cached": cached,
         }
         return response
 
+    @app.post("/api/tts/synthesize:stream")
+    async def synthesize_speech_stream(
+        payload: TtsSynthesizeRequest,
+        current_user: Dict[str, Any] = Depends(get_current_user),
+    ):
+        # No Content-Length is set, so the body goes out with chunked transfer encoding.
+        return StreamingResponse(
+            stream_tts_audio(tts_params(payload)),
+            media_type="audio/wav",
+            headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+        )
+
+    @app.get("/api/tts/tasks/{task_id}")
+    async def get_tts_task(
+        task_id: str,
+        current_user: Dict[str, Any] = Depends(get_current_user),
+    ):
+        return ensure_tts_job_access(task_id, current_user).to_dict()
+
+    @app.get("/api/tts/tasks/{task_id}/stream")
+    async def stream_tts_task(
+        task_id: str,
+        current_user: Dict[str, Any] = Depends(get_current_user),
+    ):
+        job = ensure_tts_job_access(task_id, current_user)
+        return StreamingResponse(
+            job.iter_chunks(),
+            media_type="audio/wav",
+            headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+        )
+
+    @app.post("/api/projects/{project_id}/chapters/{chapter_id}/storyboards:synthesize-speech")
+    async def synthesize_chapter_speech(
+        project_id: int,
+        chapter_id: int,
+        payload: TtsBatchRequest,
+        current_user: Dict[str, Any] = Depends(get_current_user),
+    ):
+        ensure_project_access(project_id, current_user)
+        chapter = store.chapters.get(chapter_id)
+        if not chapter or chapter["project_id"] != project_id:
+            raise HTTPException(status_code=404, detail="Chapter not found")
+        characters = store.list_characters_for_project(project_id)
+        characters_by_id = {character["id"]: character for character in characters}
+        characters_by_name = {character["display_name"]: character for character in characters}
+        storyboards = sorted(
+            store.list_storyboards(project_id=project_id, chapter_id=chapter_id),
+            key=lambda item: item.get("order_index", 0),
+        )
+
+        lines: List[tuple[Dict[str, Any], str, Dict[str, Any]]] = []
+        unique_params: Dict[str, Dict[str, Any]] = {}
+        for storyboard in storyboards:
+            text = (storyboard.get("dialogue") or "").strip()
+            if not text:
+                continue
+            character = characters_by_id.get(storyboard.get("character_id")) or characters_by_name.get(
+                storyboard.get("speaker")
+            )
+            params = {
+                "text": text,
+                "voice_type": (character or {}).get("voice_preset") or payload.voice_type,
+                "emotion": payload.emotion,
+                "speed": (character or {}).get("voice_speed") or 1.0,
+                "volume": payload.volume,
+                "sample_rate": payload.sample_rate,
+                "audio_format": payload.audio_format,
+            }
+            cache_key = tts_cache_key(params)
+            unique_params.setdefault(cache_key, params)
+            lines.append((storyboard, cache_key, character))
+
+        # Identical lines are synthesized once; distinct ones run with bounded concurrency.
+        semaphore = asyncio.Semaphore(payload.concurrency)
+
+        async def run(params: Dict[str, Any]) -> tuple[Dict[str, Any], bool]:
+            async with semaphore:
+                return await synthesize_cached(params)
+
+        results = await asyncio.gather(*(run(params) for params in unique_params.values()))
+        audio_by_key = dict(zip(unique_params.keys(), results))
+        if not all(cached for _, cached in results):
+            store._dump()
+
+        items = []
+        for storyboard, cache_key, character in lines:
+            audio, cached = audio_by_key[cache_key]
+            params = unique_params[cache_key]
+            items.append(
+                {
+                    "storyboard_id": storyboard["id"],
+                    "character_id": character["id"] if character else None,
+                    "text": params["text"],
+                    "voice_type": params["voice_type"],
+                    "speed": params["speed"],
+                    "audio_url": audio["audio_url"],
+                    "cached": cached,
+                }
+            )
+        cached_count = sum(1 for _, cached in results if cached)
+        return {
+            "chapter_id": chapter_id,
+            "items": items,
+            "total": len(items),
+            "synthesized": len(results) - cached_count,
+            "cached": cached_count,
+        }
+
     return app
 
 
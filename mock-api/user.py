@@ -1,7 +1,10 @@
 from flask import Flask, request, jsonify
 import jwt
 import datetime
+import threading
+import time
 import uuid
+from collections import OrderedDict
 from functools import wraps
 from flask_cors import CORS  # 导入CORS扩展
 
@@ -57,6 +60,51 @@ mock_db = {
     ]
 }
 
+# 全局锁：Flask 默认多线程处理请求，mock_db、用户索引和 token 缓存的读写都在锁内进行
+db_lock = threading.RLock()
+
+# 用户索引：按 id / 邮箱 / 用户名 / 手机号直接查找，避免每次线性扫描 mock_db['users']
+user_indexes = {'id': {}, 'email': {}, 'username': {}, 'phone': {}}
+
+def index_user(user):
+    for field, index in user_indexes.items():
+        if user.get(field) is not None:
+            index[user[field]] = user
+
+def find_user(field, value):
+    if value is None:
+        return None
+    with db_lock:
+        return user_indexes[field].get(value)
+
+for _user in mock_db['users']:
+    index_user(_user)
+
+# 已验证 token 缓存：token -> (exp 时间戳, 用户ID)，按 LRU 淘汰，到期即失效
+TOKEN_CACHE_MAX_ENTRIES = 1024
+token_cache = OrderedDict()
+
+def verify_token(token):
+    """返回 token 对应的用户ID；缓存命中时跳过签名校验"""
+    now = time.time()
+    with db_lock:
+        cached = token_cache.get(token)
+        if cached is not None:
+            if cached[0] <= now:
+                del token_cache[token]
+                raise jwt.ExpiredSignatureError('Signature has expired')
+            token_cache.move_to_end(token)
+            return cached[1]
+
+    # 未命中：完整验证签名（在锁外执行，不阻塞其他请求）
+    payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+    with db_lock:
+        token_cache[token] = (payload['exp'], payload['sub'])
+        token_cache.move_to_end(token)
+        while len(token_cache) > TOKEN_CACHE_MAX_ENTRIES:
+            token_cache.popitem(last=False)
+    return payload['sub']
+
 # 生成JWT Token
 def generate_token(user_id):
     payload = {
@@ -81,10 +129,9 @@ def token_required(f):
             return jsonify({'message': 'Token is missing!'}), 401
         
         try:
-            # 验证token
-            payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user_id = payload['sub']
-            current_user = next((user for user in mock_db['users'] if user['id'] == current_user_id), None)
+            # 验证token（优先命中缓存）
+            current_user_id = verify_token(token)
+            current_user = find_user('id', current_user_id)
             
             if not current_user:
                 return jsonify({'message': 'Invalid token!'}), 401
@@ -111,35 +158,38 @@ def register():
     if not data.get('organization_name') or len(data.get('organization_name')) < 2:
         return jsonify({'message': '组织名称为空或长度不足'}), 400
     
-    # 检查邮箱是否已注册
-    if any(user['email'] == data.get('email') for user in mock_db['users']):
-        return jsonify({'message': '邮箱已被注册'}), 400
-    
-    # 创建组织
-    org_id = len(mock_db['organizations']) + 1
-    organization = {
-        'id': org_id,
-        'name': data.get('organization_name'),
-        'created_at': datetime.datetime.utcnow().isoformat() + 'Z'
-    }
-    mock_db['organizations'].append(organization)
-    
-    # 创建用户
-    user_id = len(mock_db['users']) + 1
-    display_name = data.get('display_name', data.get('email').split('@')[0])
-    user = {
-        'id': user_id,
-        'username': f'org{org_id}_admin',
-        'display_name': display_name,
-        'email': data.get('email'),
-        'password': data.get('password'),
-        'phone': None,
-        'role': 'admin',
-        'organization_id': org_id,
-        'is_active': True,
-        'created_at': datetime.datetime.utcnow().isoformat() + 'Z'
-    }
-    mock_db['users'].append(user)
+    # 检查邮箱和创建记录放在同一个锁内，避免并发注册拿到重复的邮箱或ID
+    with db_lock:
+        # 检查邮箱是否已注册
+        if find_user('email', data.get('email')):
+            return jsonify({'message': '邮箱已被注册'}), 400
+        
+        # 创建组织
+        org_id = len(mock_db['organizations']) + 1
+        organization = {
+            'id': org_id,
+            'name': data.get('organization_name'),
+            'created_at': datetime.datetime.utcnow().isoformat() + 'Z'
+        }
+        mock_db['organizations'].append(organization)
+        
+        # 创建用户
+        user_id = len(mock_db['users']) + 1
+        display_name = data.get('display_name', data.get('email').split('@')[0])
+        user = {
+            'id': user_id,
+            'username': f'org{org_id}_admin',
+            'display_name': display_name,
+            'email': data.get('email'),
+            'password': data.get('password'),
+            'phone': None,
+            'role': 'admin',
+            'organization_id': org_id,
+            'is_active': True,
+            'created_at': datetime.datetime.utcnow().isoformat() + 'Z'
+        }
+        mock_db['users'].append(user)
+        index_user(user)
     
     # 生成token
     token = generate_token(user_id)
@@ -158,12 +208,8 @@ def login():
     if not username:
         return jsonify({'message': '账号不能为空'}), 400
     
-    # 查找用户（支持邮箱、用户名登录）
-    user = next(
-        (user for user in mock_db['users'] 
-         if user['email'] == username or user['username'] == username or user['phone'] == username), 
-        None
-    )
+    # 查找用户（支持邮箱、用户名、手机号登录）
+    user = find_user('email', username) or find_user('username', username) or find_user('phone', username)
     
     if not user or user['password'] != password:
         return jsonify({'message': '用户名或密码错误'}), 400
@@ -192,14 +238,17 @@ def get_all_users(current_user):
         return jsonify({'message': '权限不足'}), 403
     
     # 过滤密码字段
-    users = [{k: v for k, v in user.items() if k != 'password'} for user in mock_db['users']]
+    with db_lock:
+        users = [{k: v for k, v in user.items() if k != 'password'} for user in mock_db['users']]
     return jsonify(users), 200
 
 # 5. 获取组织列表（调试接口）
 @app.route('/api/organizations', methods=['GET'])
 @token_required
 def get_organizations(current_user):
-    return jsonify(mock_db['organizations']), 200
+    with db_lock:
+        organizations = list(mock_db['organizations'])
+    return jsonify(organizations), 200
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file